@@ -1,26 +1,37 @@
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-from math import radians, sin, cos, sqrt, atan2
+from datetime import datetime
+from types import SimpleNamespace
+from math import radians, cos
 import asyncio
 import logging
+from bisect import bisect_left
+from uuid import UUID
 
+import numpy as np
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc, asc
+from sqlalchemy import select, insert, func, and_, or_, desc, literal_column, Float
 from sqlalchemy.orm import selectinload
 
 from app.core.database import get_database
+from app.core.responses import ORJSONResponse
+from app.core.request_body import json_body, json_body_openapi
 from app.core.auth import get_current_user, get_optional_user, check_rate_limit, increment_usage_count
-from app.models import AirQualityReading, UserProfile, PredictionData, SensorDevice
+from app.models import AirQualityReading, UserProfile, PredictionData, SensorDevice, generate_uuid, SUBSCRIPTION_TIER_LEVELS
 from app.schemas.air_quality import (
     AirQualityReading as AirQualityReadingSchema,
     AirQualityReadingCreate,
     AirQualityReadingUpdate,
+    AirQualityReadingBatchCreate,
+    AirQualityReadingBatchResponse,
     AirQualityResponse,
     AQISummary,
     LocationStats,
     HistoricalDataRequest,
-    HistoricalDataResponse,
+    HistoricalDataHeader,
+    HistoricalDataPoint,
     PredictionRequest,
     PredictionResponse,
     PredictionData as PredictionDataSchema,
@@ -39,28 +50,270 @@ from app.schemas.air_quality import (
     AQICategory
 )
 from app.core.config import settings
+from app.core.geo import haversine, distances_from, distances_from_radians, to_radians, morton_code
 from app.services.external_api_service import ExternalAPIService
-from app.services.cache_service import CacheService
+from app.services.cache_service import CacheService, pack_value
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # Initialize services
-external_api_service = ExternalAPIService()
 cache_service = CacheService()
+external_api_service = ExternalAPIService(cache_service)
+
+# Redis geo index (geohash-scored sorted set) of each sensor's latest position
+SENSOR_GEO_KEY = "sensors:geo"
+
+# Match radii (meters) for point lookups, roughly the 0.001 and 0.01 degree boxes used before
+BULK_MATCH_RADIUS = 111.0
+HISTORICAL_RADIUS = 1110.0
+
+# Recency cutoffs evaluated by the database; reading_time is stored as naive UTC
+DB_UTC_NOW = func.timezone("UTC", func.now())
+RECENT_24H = DB_UTC_NOW - literal_column("INTERVAL '24 hours'")
+RECENT_1H = DB_UTC_NOW - literal_column("INTERVAL '1 hour'")
+
+# Columns exposed by the AirQualityReading schema; read paths select these as plain rows
+# instead of hydrating ORM instances
+READING_COLUMNS = (
+    AirQualityReading.id,
+    AirQualityReading.latitude,
+    AirQualityReading.longitude,
+    AirQualityReading.pm25,
+    AirQualityReading.pm10,
+    AirQualityReading.no2,
+    AirQualityReading.so2,
+    AirQualityReading.co,
+    AirQualityReading.o3,
+    AirQualityReading.aqi,
+    AirQualityReading.aqi_category,
+    AirQualityReading.lung_safety_score,
+    AirQualityReading.source,
+    AirQualityReading.sensor_id,
+    AirQualityReading.reading_time,
+    AirQualityReading.created_at,
+    AirQualityReading.updated_at,
+    AirQualityReading.gps_accuracy,
+    AirQualityReading.temperature,
+    AirQualityReading.humidity,
+    AirQualityReading.pressure,
+    AirQualityReading.wind_speed,
+    AirQualityReading.wind_direction,
+    AirQualityReading.location_name,
+    AirQualityReading.city,
+    AirQualityReading.country,
+    AirQualityReading.confidence_score,
+    AirQualityReading.calibration_factor
+)
+
+# Lung safety score bands: upper AQI edges and (band start, intercept, slope, floor) per band
+_LUNG_SCORE_EDGES = (50, 100, 150, 200, 300)
+_LUNG_SCORE_BANDS = (
+    (0, 95.0, 0.0, 95.0),
+    (50, 80.0, 0.3, 0.0),
+    (100, 65.0, 0.5, 0.0),
+    (150, 45.0, 0.4, 0.0),
+    (200, 25.0, 0.2, 0.0),
+    (300, 15.0, 0.1, 5.0)
+)
+
+# Score multiplier per health condition, combined into a lookup indexed by condition bitmask
+_HEALTH_CONDITION_BITS = ("respiratory", "cardiovascular", "smoker")
+_HEALTH_CONDITION_FACTORS = (0.85, 0.9, 0.9)
+
+def _build_conditions_multipliers() -> tuple:
+    """Product of the condition factors for every bitmask"""
+    multipliers = []
+    for mask in range(1 << len(_HEALTH_CONDITION_FACTORS)):
+        multiplier = 1.0
+        for bit, factor in enumerate(_HEALTH_CONDITION_FACTORS):
+            if mask & (1 << bit):
+                multiplier *= factor
+        multipliers.append(multiplier)
+    return tuple(multipliers)
+
+_CONDITIONS_MULTIPLIERS = _build_conditions_multipliers()
+
+# Cached readings are keyed by ~100 m grid cell (0.001 degree) and 5 minute bucket so that
+# nearby queries can probe the cells around a point; larger radii go straight to the database
+READING_CACHE_BUCKET = 300
+MAX_CACHE_PROBE_CELLS = 64
+
+# Numeric fields of AirQualityReadingCreate held as float64 columns (NaN for missing) during batch ingest
+INGEST_FLOAT_FIELDS = (
+    "latitude", "longitude", "pm25", "pm10", "no2", "so2", "co", "o3",
+    "temperature", "humidity", "pressure", "wind_speed", "wind_direction"
+)
+INGEST_OBJECT_FIELDS = ("source", "sensor_id", "reading_time")
+
+# Columns of bulk responses summarized as arrays
+SUMMARY_FIELDS = ("pm25", "pm10", "aqi")
+
+# date_trunc units for the historical aggregation options
+AGGREGATION_BUCKETS = {"hourly": "hour", "daily": "day", "weekly": "week"}
+
+# EPA breakpoint tables as (c_lo, c_hi, i_lo, i_hi) rows. A band is selected by
+# its upper concentration edge; c_lo/c_hi are the values used for the slope.
+PM25_TABLE = (
+    (0.0, 12.0, 0, 50),
+    (12.1, 35.4, 51, 100),
+    (35.5, 55.5, 101, 150),
+    (55.6, 150.5, 151, 200),
+    (150.5, 250.5, 201, 300),
+    (250.5, 500.4, 301, 500),
+)
+PM25_HI_EDGES = (12.0, 35.4, 55.4, 150.4, 250.4)
+PM10_TABLE = (
+    (0.0, 54.0, 0, 50),
+    (55.0, 154.0, 51, 100),
+    (155.0, 254.0, 101, 150),
+    (255.0, 354.0, 151, 200),
+    (355.0, 424.0, 201, 300),
+    (425.0, 604.0, 301, 500),
+)
+PM10_HI_EDGES = (54.0, 154.0, 254.0, 354.0, 424.0)
+
+# Per-band constants for the scalar path, precomputed once
+PM25_LO = tuple(row[0] for row in PM25_TABLE)
+PM25_ILO = tuple(row[2] for row in PM25_TABLE)
+PM25_SLOPES = tuple((i_hi - i_lo) / (c_hi - c_lo) for c_lo, c_hi, i_lo, i_hi in PM25_TABLE)
+PM10_LO = tuple(row[0] for row in PM10_TABLE)
+PM10_ILO = tuple(row[2] for row in PM10_TABLE)
+PM10_SLOPES = tuple((i_hi - i_lo) / (c_hi - c_lo) for c_lo, c_hi, i_lo, i_hi in PM10_TABLE)
+
+AQI_CATEGORY_THRESHOLDS = (50, 100, 150, 200, 300)
+AQI_CATEGORIES = (
+    AQICategory.GOOD,
+    AQICategory.MODERATE,
+    AQICategory.UNHEALTHY_FOR_SENSITIVE,
+    AQICategory.UNHEALTHY,
+    AQICategory.VERY_UNHEALTHY,
+    AQICategory.HAZARDOUS
+)
+
+# The same tables as NumPy arrays for the vectorized path
+PM25_BP_EDGES = np.array(PM25_HI_EDGES)
+PM25_BP_LO = np.array(PM25_LO)
+PM25_BP_SLOPES = np.array(PM25_SLOPES)
+PM10_BP_EDGES = np.array(PM10_HI_EDGES)
+PM10_BP_LO = np.array(PM10_LO)
+PM10_BP_SLOPES = np.array(PM10_SLOPES)
+AQI_LO = np.array(PM25_ILO, dtype=np.float64)
+AQI_CATEGORY_EDGES = np.array(AQI_CATEGORY_THRESHOLDS)
+AQI_CATEGORY_LOOKUP = np.array(AQI_CATEGORIES, dtype=object)
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
+    """Calculate distance in meters between two points using Haversine formula"""
+    return haversine(lat1, lon1, lat2, lon2)
+
+def radius_condition(latitude: float, longitude: float, radius: float, dialect_name: str):
+    """
+    SQL predicate for readings within ``radius`` meters of a point.
+    On Postgres this is an exact earthdistance check served by the GiST index;
+    elsewhere it is a bounding box that callers refine with filter_within_radius.
+    """
+    if dialect_name == "postgresql":
+        center = func.ll_to_earth(latitude, longitude)
+        point = func.ll_to_earth(AirQualityReading.latitude, AirQualityReading.longitude)
+        return and_(
+            func.earth_box(center, radius).op("@>")(point),
+            func.earth_distance(center, point) <= radius
+        )
     
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
+    dlat = radius / 111000.0
+    dlon = dlat / cos(radians(latitude))
+    return and_(
+        AirQualityReading.latitude.between(latitude - dlat, latitude + dlat),
+        AirQualityReading.longitude.between(longitude - dlon, longitude + dlon)
+    )
+
+def latest_sensor_positions(readings) -> Dict[str, tuple]:
+    """Most recent (latitude, longitude) per sensor among ``readings`` (schemas or rows)"""
+    positions = {}
+    for r in sorted((r for r in readings if r.sensor_id is not None), key=lambda r: r.reading_time.timestamp()):
+        positions[str(r.sensor_id)] = (r.latitude, r.longitude)
+    return positions
+
+def reading_to_dict(reading) -> Dict[str, Any]:
+    """Response payload for a reading row (or ORM instance) restricted to READING_COLUMNS"""
+    return {column.key: getattr(reading, column.key) for column in READING_COLUMNS}
+
+def _encode_reading(reading: Dict[str, Any]) -> bytes:
+    """Serialize a reading dict for the cache; datetimes are stored as epoch integers, not ISO strings"""
+    return pack_value(reading)
+
+def build_external_reading(latitude: float, longitude: float,
+                           external_data: Dict[str, Any]) -> AirQualityReading:
+    """Reading row for data returned by an external provider"""
+    return AirQualityReading(**{
+        **external_data,
+        "latitude": latitude,
+        "longitude": longitude,
+        "source": "external_api"
+    })
+
+def reading_cache_key(latitude: float, longitude: float, reading_time: datetime) -> str:
+    """Cache key of the grid cell and time bucket a reading falls into"""
+    timestamp = int(reading_time.timestamp())
+    return _cell_cache_key(round(latitude * 1000), round(longitude * 1000), timestamp - timestamp % READING_CACHE_BUCKET)
+
+def _cell_cache_key(lat_cell: int, lon_cell: int, bucket: int) -> str:
+    return f"rd:{morton_code(lat_cell, lon_cell, 1000):x}:{bucket}"
+
+async def get_cached_readings(latitude: float, longitude: float,
+                              radius: float, limit: int) -> List[SimpleNamespace]:
+    """
+    Readings cached in the current or previous time bucket within ``radius`` meters, newest first.
+    Returns an empty list when the radius covers more than MAX_CACHE_PROBE_CELLS cells.
+    """
+    dlat = radius / 111000.0
+    dlon = dlat / cos(radians(latitude))
+    lat_cells = range(round((latitude - dlat) * 1000), round((latitude + dlat) * 1000) + 1)
+    lon_cells = range(round((longitude - dlon) * 1000), round((longitude + dlon) * 1000) + 1)
+    if len(lat_cells) * len(lon_cells) > MAX_CACHE_PROBE_CELLS:
+        return []
     
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    timestamp = int(datetime.utcnow().timestamp())
+    current_bucket = timestamp - timestamp % READING_CACHE_BUCKET
+    keys = [
+        _cell_cache_key(lat_cell, lon_cell, bucket)
+        for bucket in (current_bucket, current_bucket - READING_CACHE_BUCKET)
+        for lat_cell in lat_cells
+        for lon_cell in lon_cells
+    ]
     
-    return R * c * 1000  # Convert to meters
+    readings = []
+    for cached in await cache_service.get_many_packed(keys):
+        if cached:
+            reading = SimpleNamespace(**{**dict.fromkeys(column.key for column in READING_COLUMNS), **cached})
+            if isinstance(reading.reading_time, str):  # written before epoch encoding
+                reading.reading_time = datetime.fromisoformat(reading.reading_time)
+            readings.append(reading)
+    
+    readings = filter_within_radius(readings, latitude, longitude, radius)
+    readings.sort(key=lambda r: r.reading_time, reverse=True)
+    return readings[:limit]
+
+def merge_readings(cached: List[Any], fetched: List[Any], limit: int) -> List[Any]:
+    """Cached and database readings without duplicates, newest first, at most ``limit``"""
+    if not cached:
+        return fetched
+    seen = {str(r.id) for r in fetched}
+    merged = [*fetched, *(r for r in cached if str(r.id) not in seen)]
+    merged.sort(key=lambda r: r.reading_time, reverse=True)
+    return merged[:limit]
+
+def filter_within_radius(readings: List[Any], latitude: float,
+                         longitude: float, radius: float) -> List[Any]:
+    """Drop readings outside ``radius`` meters, preserving order (fallback for non-Postgres databases)"""
+    if not readings:
+        return []
+    distances = distances_from(
+        latitude, longitude,
+        [r.latitude for r in readings],
+        [r.longitude for r in readings]
+    )
+    return [r for r, d in zip(readings, distances.tolist()) if d <= radius]
 
 def calculate_aqi(pm25: Optional[float], pm10: Optional[float], 
                   no2: Optional[float], so2: Optional[float],
@@ -69,96 +322,177 @@ def calculate_aqi(pm25: Optional[float], pm10: Optional[float],
     Calculate Air Quality Index and category
     Returns: (aqi_value, category, primary_pollutant)
     """
-    aqi_values = []
+    max_aqi = 0
+    primary_pollutant = None
     
-    # PM2.5 breakpoints
     if pm25 is not None:
-        if pm25 <= 12.0:
-            aqi_pm25 = int((50/12.0) * pm25)
-        elif pm25 <= 35.4:
-            aqi_pm25 = int(((100-51)/(35.4-12.1)) * (pm25 - 12.1) + 51)
-        elif pm25 <= 55.4:
-            aqi_pm25 = int(((150-101)/(55.5-35.5)) * (pm25 - 35.5) + 101)
-        elif pm25 <= 150.4:
-            aqi_pm25 = int(((200-151)/(150.5-55.6)) * (pm25 - 55.6) + 151)
-        elif pm25 <= 250.4:
-            aqi_pm25 = int(((300-201)/(250.5-150.5)) * (pm25 - 150.5) + 201)
-        else:
-            aqi_pm25 = int(((500-301)/(500.4-250.5)) * (pm25 - 250.5) + 301)
-        aqi_values.append(("PM2.5", aqi_pm25))
+        i = bisect_left(PM25_HI_EDGES, pm25)
+        max_aqi = int(PM25_SLOPES[i] * (pm25 - PM25_LO[i]) + PM25_ILO[i])
+        primary_pollutant = "PM2.5"
     
-    # PM10 breakpoints
     if pm10 is not None:
-        if pm10 <= 54:
-            aqi_pm10 = int((50/54) * pm10)
-        elif pm10 <= 154:
-            aqi_pm10 = int(((100-51)/(154-55)) * (pm10 - 55) + 51)
-        elif pm10 <= 254:
-            aqi_pm10 = int(((150-101)/(254-155)) * (pm10 - 155) + 101)
-        elif pm10 <= 354:
-            aqi_pm10 = int(((200-151)/(354-255)) * (pm10 - 255) + 151)
-        elif pm10 <= 424:
-            aqi_pm10 = int(((300-201)/(424-355)) * (pm10 - 355) + 201)
-        else:
-            aqi_pm10 = int(((500-301)/(604-425)) * (pm10 - 425) + 301)
-        aqi_values.append(("PM10", aqi_pm10))
+        i = bisect_left(PM10_HI_EDGES, pm10)
+        aqi_pm10 = int(PM10_SLOPES[i] * (pm10 - PM10_LO[i]) + PM10_ILO[i])
+        if primary_pollutant is None or aqi_pm10 > max_aqi:
+            max_aqi = aqi_pm10
+            primary_pollutant = "PM10"
     
     # Return the highest AQI value
-    if not aqi_values:
+    if primary_pollutant is None:
         return 0, AQICategory.GOOD, None
     
-    primary_pollutant, max_aqi = max(aqi_values, key=lambda x: x[1])
+    category = AQI_CATEGORIES[bisect_left(AQI_CATEGORY_THRESHOLDS, max_aqi)]
+    
+    return max_aqi, category, primary_pollutant
+
+def _pollutant_aqi_bulk(conc: np.ndarray, edges: np.ndarray,
+                        bp_lo: np.ndarray, slopes: np.ndarray) -> np.ndarray:
+    """Piecewise-linear AQI for one pollutant; NaN concentrations stay NaN"""
+    idx = np.searchsorted(edges, np.nan_to_num(conc), side='left')
+    return np.trunc(slopes[idx] * (conc - bp_lo[idx]) + AQI_LO[idx])
+
+def calculate_aqi_bulk(pm25: np.ndarray, pm10: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized counterpart of calculate_aqi for many readings at once.
+    Missing concentrations are passed as NaN.
+    Returns: (aqi_values, categories, primary_pollutants)
+    """
+    pm25 = np.asarray(pm25, dtype=np.float64)
+    pm10 = np.asarray(pm10, dtype=np.float64)
+    
+    aqi_pm25 = _pollutant_aqi_bulk(pm25, PM25_BP_EDGES, PM25_BP_LO, PM25_BP_SLOPES)
+    aqi_pm10 = _pollutant_aqi_bulk(pm10, PM10_BP_EDGES, PM10_BP_LO, PM10_BP_SLOPES)
+    
+    # fmax ignores NaN, so a reading with a single pollutant still gets an AQI
+    combined = np.fmax(aqi_pm25, aqi_pm10)
+    aqi = np.nan_to_num(combined, nan=0.0).astype(np.int64)
+    
+    categories = AQI_CATEGORY_LOOKUP[np.digitize(aqi, AQI_CATEGORY_EDGES, right=True)]
+    
+    primary = np.full(aqi.shape, None, dtype=object)
+    primary[~np.isnan(aqi_pm10)] = "PM10"
+    primary[~np.isnan(aqi_pm25) & ~(aqi_pm10 > aqi_pm25)] = "PM2.5"
+    
+    return aqi, categories, primary
+
+def fill_missing_aqi(readings: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Compute AQI for readings stored without one (e.g. external API rows) in one vectorized pass.
+    Returns the readings' pm25/pm10/aqi as arrays (NaN where missing) for further statistics.
+    """
+    count = len(readings)
+    soa = {
+        field: np.fromiter(
+            (np.nan if r[field] is None else r[field] for r in readings),
+            dtype=np.float64, count=count
+        )
+        for field in SUMMARY_FIELDS
+    }
+    
+    missing = np.flatnonzero(np.isnan(soa["aqi"]))
+    if missing.size:
+        aqi_values, categories, _ = calculate_aqi_bulk(soa["pm25"][missing], soa["pm10"][missing])
+        soa["aqi"][missing] = aqi_values
+        for i, aqi, category in zip(missing.tolist(), aqi_values.tolist(), categories):
+            readings[i]["aqi"] = aqi
+            readings[i]["aqi_category"] = category.value
+    
+    return soa
+
+def soa_statistics(soa: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """AQI and pollutant summaries over the arrays returned by fill_missing_aqi"""
+    aqi = soa["aqi"][~np.isnan(soa["aqi"])]
+    if not aqi.size:
+        return {"count": 0}
+    
+    pm25 = soa["pm25"][~np.isnan(soa["pm25"])]
+    pm10 = soa["pm10"][~np.isnan(soa["pm10"])]
+    return {
+        "count": int(aqi.size),
+        "aqi_min": int(aqi.min()),
+        "aqi_max": int(aqi.max()),
+        "aqi_avg": float(aqi.mean()),
+        "aqi_median": float(np.median(aqi)),
+        "pm25_avg": float(pm25.mean()) if pm25.size else None,
+        "pm10_avg": float(pm10.mean()) if pm10.size else None
+    }
+
+def readings_to_soa(readings: List[AirQualityReadingCreate]) -> Dict[str, np.ndarray]:
+    """Transpose validated readings into one array per field"""
+    count = len(readings)
+    soa = {}
+    for field in INGEST_FLOAT_FIELDS:
+        soa[field] = np.fromiter(
+            (np.nan if value is None else value for value in (getattr(r, field) for r in readings)),
+            dtype=np.float64, count=count
+        )
+    for field in INGEST_OBJECT_FIELDS:
+        soa[field] = np.array([getattr(r, field) for r in readings], dtype=object)
+    return soa
+
+def _column_values(values: np.ndarray) -> list:
+    """Column as plain Python values, with NaN mapped to NULL"""
+    if values.dtype.kind == "f":
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+async def bulk_ingest(readings_soa: Dict[str, np.ndarray], db: AsyncSession,
+                      user_id: Optional[UUID] = None) -> int:
+    """
+    Insert a batch of readings given as field arrays, computing AQI for the whole batch at once.
+    Uses COPY on Postgres and a single executemany elsewhere; no ORM instances are created.
+    """
+    count = len(readings_soa["latitude"])
+    if count == 0:
+        return 0
     
-    # Determine category
-    if max_aqi <= 50:
-        category = AQICategory.GOOD
-    elif max_aqi <= 100:
-        category = AQICategory.MODERATE
-    elif max_aqi <= 150:
-        category = AQICategory.UNHEALTHY_FOR_SENSITIVE
-    elif max_aqi <= 200:
-        category = AQICategory.UNHEALTHY
-    elif max_aqi <= 300:
-        category = AQICategory.VERY_UNHEALTHY
+    aqi_values, categories, _ = calculate_aqi_bulk(readings_soa["pm25"], readings_soa["pm10"])
+    
+    columns = {field: _column_values(values) for field, values in readings_soa.items()}
+    columns["id"] = [generate_uuid() for _ in range(count)]
+    columns["aqi"] = aqi_values.tolist()
+    columns["aqi_category"] = [category.value for category in categories]
+    columns["user_id"] = [user_id] * count
+    columns["confidence_score"] = [1.0] * count
+    columns["calibration_factor"] = [1.0] * count
+    
+    names = list(columns)
+    records = zip(*columns.values())
+    
+    connection = await db.connection()
+    if connection.dialect.name == "postgresql":
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            AirQualityReading.__tablename__, records=list(records), columns=names
+        )
     else:
-        category = AQICategory.HAZARDOUS
+        await db.execute(insert(AirQualityReading), [dict(zip(names, record)) for record in records])
     
-    return max_aqi, category, primary_pollutant
+    await db.commit()
+    return count
 
 def calculate_lung_safety_score(aqi: int, health_conditions: Optional[List[str]] = None) -> float:
     """Calculate lung safety score (0-100, higher is safer)"""
     if health_conditions is None:
         health_conditions = []
     
-    # Base score calculation
-    if aqi <= 50:
-        base_score = 95.0
-    elif aqi <= 100:
-        base_score = 80.0 - ((aqi - 50) * 0.3)
-    elif aqi <= 150:
-        base_score = 65.0 - ((aqi - 100) * 0.5)
-    elif aqi <= 200:
-        base_score = 45.0 - ((aqi - 150) * 0.4)
-    elif aqi <= 300:
-        base_score = 25.0 - ((aqi - 200) * 0.2)
-    else:
-        base_score = max(5.0, 15.0 - ((aqi - 300) * 0.1))
+    # Base score: linear within the AQI band, clamped at the band floor
+    band_start, intercept, slope, floor = _LUNG_SCORE_BANDS[bisect_left(_LUNG_SCORE_EDGES, aqi)]
+    base_score = max(floor, intercept - ((aqi - band_start) * slope))
     
     # Adjust for health conditions
-    conditions_multiplier = 1.0
-    if "respiratory" in health_conditions:
-        conditions_multiplier *= 0.85
-    if "cardiovascular" in health_conditions:
-        conditions_multiplier *= 0.9
-    if "smoker" in health_conditions:
-        conditions_multiplier *= 0.9
+    mask = 0
+    for bit, condition in enumerate(_HEALTH_CONDITION_BITS):
+        if condition in health_conditions:
+            mask |= 1 << bit
     
-    return max(0.0, min(100.0, base_score * conditions_multiplier))
+    return max(0.0, min(100.0, base_score * _CONDITIONS_MULTIPLIERS[mask]))
 
-@router.post("/readings", response_model=AirQualityReadingSchema, status_code=status.HTTP_201_CREATED)
+@router.post("/readings", response_model=AirQualityReadingSchema, status_code=status.HTTP_201_CREATED,
+             openapi_extra=json_body_openapi(AirQualityReadingCreate))
 async def create_air_quality_reading(
-    reading: AirQualityReadingCreate,
     background_tasks: BackgroundTasks,
+    reading: AirQualityReadingCreate = Depends(json_body(AirQualityReadingCreate)),
     db: AsyncSession = Depends(get_database),
     current_user: Optional[UserProfile] = Depends(get_optional_user)
 ):
@@ -195,17 +529,26 @@ async def create_air_quality_reading(
         await db.commit()
         await db.refresh(db_reading)
         
-        # Cache the reading for quick access
-        cache_key = f"reading_{db_reading.latitude}_{db_reading.longitude}_{int(reading.reading_time.timestamp())}"
-        await cache_service.set(cache_key, db_reading, ttl=settings.CACHE_TTL)
+        # Cache the reading for quick access once the response is sent
+        cache_key = reading_cache_key(reading.latitude, reading.longitude, reading.reading_time)
+        payload = _encode_reading({
+            **reading.dict(),
+            "id": db_reading.id,
+            "aqi": aqi,
+            "aqi_category": category.value if category else None,
+            "lung_safety_score": lung_safety_score
+        })
+        background_tasks.add_task(cache_service.set_packed, cache_key, payload, settings.CACHE_TTL)
+        if reading.sensor_id is not None:
+            background_tasks.add_task(cache_service.geo_add, SENSOR_GEO_KEY, latest_sensor_positions([reading]))
         
         # Update user's daily count
         if current_user:
-            await increment_usage_count(current_user, "query")
-            db.add(current_user)
-            await db.commit()
+            background_tasks.add_task(increment_usage_count, current_user, "query")
         
-        return AirQualityReadingSchema.from_orm(db_reading)
+        # The row was just validated on the way in and refreshed from the database;
+        # return it as-is rather than re-validating it through the response model
+        return ORJSONResponse(reading_to_dict(db_reading), status_code=status.HTTP_201_CREATED)
         
     except Exception as e:
         await db.rollback()
@@ -215,8 +558,39 @@ async def create_air_quality_reading(
             detail="Failed to create air quality reading"
         )
 
+@router.post("/readings/batch", response_model=AirQualityReadingBatchResponse, status_code=status.HTTP_201_CREATED,
+             openapi_extra=json_body_openapi(AirQualityReadingBatchCreate))
+async def create_air_quality_readings_batch(
+    background_tasks: BackgroundTasks,
+    request: AirQualityReadingBatchCreate = Depends(json_body(AirQualityReadingBatchCreate)),
+    db: AsyncSession = Depends(get_database),
+    current_user: Optional[UserProfile] = Depends(get_optional_user)
+):
+    """Create many air quality readings at once (sensor uploads)"""
+    try:
+        inserted = await bulk_ingest(
+            readings_to_soa(request.readings),
+            db,
+            user_id=current_user.id if current_user else None
+        )
+        
+        if current_user:
+            background_tasks.add_task(increment_usage_count, current_user, "query")
+        background_tasks.add_task(cache_service.geo_add, SENSOR_GEO_KEY, latest_sensor_positions(request.readings))
+        
+        return AirQualityReadingBatchResponse(inserted=inserted)
+        
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error creating air quality readings batch: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create air quality readings"
+        )
+
 @router.get("/readings/nearby", response_model=AirQualityResponse)
 async def get_nearby_air_quality(
+    background_tasks: BackgroundTasks,
     latitude: float = Query(..., ge=-90, le=90),
     longitude: float = Query(..., ge=-180, le=180),
     radius: int = Query(default=1000, ge=100, le=50000),
@@ -226,43 +600,51 @@ async def get_nearby_air_quality(
 ):
     """Get air quality readings near a location"""
     try:
+        # Readings POSTed in the last few minutes are cached for small radii
+        cached_readings = get_cached_readings(latitude, longitude, radius, limit)
+        
         # Check rate limit for non-authenticated users
         if not current_user:
-            # For anonymous users, implement global rate limiting
+            # For anonymous users, implement global rate limiting; the counter and the
+            # cache lookup are independent Redis round trips, so run them together
             cache_key = f"anon_queries_{datetime.utcnow().strftime('%Y%m%d')}"
-            current_count = await cache_service.get(cache_key, default=0)
-            if current_count >= settings.FREE_TIER_LIMITS["daily_queries"]:
+            current_count, readings = await asyncio.gather(
+                cache_service.increment(cache_key, ttl=86400),
+                cached_readings
+            )
+            if current_count is not None and current_count > settings.FREE_TIER_LIMITS.daily_queries:
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                     detail="Daily query limit reached. Please sign up for free account to continue."
                 )
-            await cache_service.increment(cache_key)
-        
-        # Get recent readings within radius
-        readings_query = select(AirQualityReading).where(
-            and_(
-                AirQualityReading.latitude >= latitude - (radius / 111000),
-                AirQualityReading.latitude <= latitude + (radius / 111000),
-                AirQualityReading.longitude >= longitude - (radius / (111000 * cos(radians(latitude)))),
-                AirQualityReading.longitude <= longitude + (radius / (111000 * cos(radians(latitude)))),
-                AirQualityReading.reading_time >= datetime.utcnow() - timedelta(hours=24)
-            )
-        ).order_by(desc(AirQualityReading.reading_time)).limit(limit)
+        else:
+            readings = await cached_readings
         
-        result = await db.execute(readings_query)
-        readings = result.scalars().all()
+        # The cache only sees single POSTs from the last few minutes, so it stands in for
+        # the database only when it already fills the page; otherwise the two are merged
+        if len(readings) < limit:
+            dialect_name = db.bind.dialect.name
+            readings_query = select(*READING_COLUMNS).where(
+                and_(
+                    radius_condition(latitude, longitude, radius, dialect_name),
+                    AirQualityReading.reading_time >= RECENT_24H
+                )
+            ).order_by(desc(AirQualityReading.reading_time))
+            if dialect_name == "postgresql":
+                readings_query = readings_query.limit(limit)
+            
+            result = await db.execute(readings_query)
+            db_readings = result.all()
+            if dialect_name != "postgresql":
+                db_readings = filter_within_radius(db_readings, latitude, longitude, radius)[:limit]
+            readings = merge_readings(readings, db_readings, limit)
         
         if not readings:
             # Try to fetch from external APIs
             external_data = await external_api_service.get_air_quality_data(latitude, longitude)
             if external_data:
                 # Create reading from external data
-                external_reading = AirQualityReading(
-                    latitude=latitude,
-                    longitude=longitude,
-                    source="external_api",
-                    **external_data
-                )
+                external_reading = build_external_reading(latitude, longitude, external_data)
                 db.add(external_reading)
                 await db.commit()
                 await db.refresh(external_reading)
@@ -287,13 +669,8 @@ async def get_nearby_air_quality(
         )
         
         # Calculate location statistics
-        aqi_values = [r.aqi for r in readings if r.aqi is not None]
-        if aqi_values:
-            avg_aqi = sum(aqi_values) / len(aqi_values)
-            trend = calculate_trend(aqi_values)
-        else:
-            avg_aqi = None
-            trend = None
+        aqi_values = np.fromiter((r.aqi for r in readings if r.aqi is not None), dtype=np.int32)
+        trend = calculate_trend(aqi_values)
         
         location_stats = LocationStats(
             location_name=f"Lat {latitude:.4f}, Lon {longitude:.4f}",
@@ -307,15 +684,13 @@ async def get_nearby_air_quality(
         
         # Update user usage
         if current_user:
-            await increment_usage_count(current_user, "query")
-            db.add(current_user)
-            await db.commit()
-        
-        return AirQualityResponse(
-            current=current_summary,
-            nearby_readings=[AirQualityReadingSchema.from_orm(r) for r in readings],
-            location_stats=location_stats
-        )
+            background_tasks.add_task(increment_usage_count, current_user, "query")
+        
+        return ORJSONResponse({
+            "current": current_summary,
+            "nearby_readings": [reading_to_dict(r) for r in readings],
+            "location_stats": location_stats
+        })
         
     except HTTPException:
         raise
@@ -335,65 +710,85 @@ async def get_bulk_air_quality(
     """Get air quality data for multiple locations (Pro feature)"""
     try:
         # Check if user has pro subscription
-        if current_user.subscription_tier != "pro" and current_user.subscription_tier != "enterprise":
+        if current_user.subscription_tier_level < SUBSCRIPTION_TIER_LEVELS["pro"]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Bulk queries require Pro subscription or higher"
             )
         
-        # Check rate limit
-        if not check_rate_limit(current_user, "query"):
+        locations = [(loc["lat"], loc["lon"]) for loc in request.locations]
+        
+        # Check rate limit (Redis) while fetching recent readings for every location
+        # in a single query (Postgres); the two round trips are independent
+        rate_limit_check = check_rate_limit(current_user, "query")
+        candidates = []
+        if locations:
+            readings_query = select(*READING_COLUMNS).where(
+                and_(
+                    or_(*[
+                        radius_condition(lat, lon, BULK_MATCH_RADIUS, db.bind.dialect.name)
+                        for lat, lon in locations
+                    ]),
+                    AirQualityReading.reading_time >= RECENT_1H
+                )
+            ).order_by(desc(AirQualityReading.reading_time))
+        
+            within_limit, result = await asyncio.gather(rate_limit_check, db.execute(readings_query))
+            candidates = result.all()
+        else:
+            within_limit = await rate_limit_check
+        
+        if not within_limit:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Daily query limit exceeded"
             )
         
-        readings = []
-        
-        # Process each location
-        for loc in request.locations:
-            lat = loc["lat"]
-            lon = loc["lon"]
-            
-            # Get recent reading for this location
-            reading_query = select(AirQualityReading).where(
-                and_(
-                    AirQualityReading.latitude.between(lat - 0.001, lat + 0.001),
-                    AirQualityReading.longitude.between(lon - 0.001, lon + 0.001),
-                    AirQualityReading.reading_time >= datetime.utcnow() - timedelta(hours=1)
+        # Bucket rows by location; rows are newest first so the first match wins
+        latest: Dict[int, Dict[str, Any]] = {}
+        if candidates:
+            # Convert candidate coordinates once rather than per requested location
+            candidate_lats = to_radians([r.latitude for r in candidates])
+            candidate_lons = to_radians([r.longitude for r in candidates])
+            for i, (lat, lon) in enumerate(locations):
+                within = np.flatnonzero(
+                    distances_from_radians(lat, lon, candidate_lats, candidate_lons) <= BULK_MATCH_RADIUS
                 )
-            ).order_by(desc(AirQualityReading.reading_time)).limit(1)
-            
-            result = await db.execute(reading_query)
-            reading = result.scalar_one_or_none()
-            
-            if reading:
-                readings.append(reading)
-            else:
-                # Try external API
-                external_data = await external_api_service.get_air_quality_data(lat, lon)
-                if external_data:
-                    new_reading = AirQualityReading(
-                        latitude=lat,
-                        longitude=lon,
-                        source="external_api",
-                        **external_data
-                    )
-                    readings.append(new_reading)
-        
-        # Update usage
-        await increment_usage_count(current_user, "query")
-        db.add(current_user)
+                if within.size:
+                    latest[i] = reading_to_dict(candidates[within[0]])
+        
+        # Fetch locations without a recent reading from external APIs; cached cells come back
+        # from a single MGET and the rest are fetched concurrently (bounded by the service)
+        missing = [i for i in range(len(locations)) if i not in latest]
+        external_results = await external_api_service.get_air_quality_data_many([locations[i] for i in missing])
+        external_readings = {
+            i: build_external_reading(*locations[i], external_data)
+            for i, external_data in zip(missing, external_results)
+            if external_data
+        }
+        
+        # Store the fetched readings
+        db.add_all(external_readings.values())
         await db.commit()
         
-        return BulkAirQualityResponse(
-            readings=[AirQualityReadingSchema.from_orm(r) for r in readings],
-            summary={
+        for i, external_reading in external_readings.items():
+            latest[i] = reading_to_dict(external_reading)
+        
+        readings = [latest[i] for i in range(len(locations)) if i in latest]
+        
+        # External readings arrive without an AQI; compute them all at once and summarize
+        # the pollutant columns as arrays rather than looping over the reading dicts
+        soa = fill_missing_aqi(readings)
+        
+        return ORJSONResponse({
+            "readings": readings,
+            "summary": {
                 "locations_requested": len(request.locations),
                 "readings_found": len(readings),
-                "coverage_percentage": len(readings) / len(request.locations) * 100 if request.locations else 0
+                "coverage_percentage": len(readings) / len(request.locations) * 100 if request.locations else 0,
+                "statistics": soa_statistics(soa)
             }
-        )
+        })
         
     except HTTPException:
         raise
@@ -404,50 +799,72 @@ async def get_bulk_air_quality(
             detail="Failed to process bulk air quality query"
         )
 
-@router.get("/readings/historical", response_model=HistoricalDataResponse)
+@router.get(
+    "/readings/historical",
+    responses={200: {
+        "description": "One HistoricalDataHeader line, then one HistoricalDataPoint line per bucket",
+        "content": {"application/x-ndjson": {"schema": {"oneOf": [
+            HistoricalDataHeader.model_json_schema(),
+            HistoricalDataPoint.model_json_schema()
+        ]}}}
+    }}
+)
 async def get_historical_data(
     request: HistoricalDataRequest = Depends(),
     aggregation: str = Query(default="hourly", regex="^(hourly|daily|weekly)$"),
     db: AsyncSession = Depends(get_database)
 ):
-    """Get historical air quality data for a location"""
+    """
+    Get historical air quality data for a location, streamed as newline-delimited JSON.
+    The first line holds location, period and statistics; each following line is one
+    aggregated data point (timestamp, count, aqi_avg/min/max/median, pm25_avg, pm10_avg).
+    """
     try:
-        # Get readings for the specified period
-        readings_query = select(AirQualityReading).where(
-            and_(
-                AirQualityReading.latitude.between(request.latitude - 0.01, request.latitude + 0.01),
-                AirQualityReading.longitude.between(request.longitude - 0.01, request.longitude + 0.01),
-                AirQualityReading.reading_time >= request.start_date,
-                AirQualityReading.reading_time <= request.end_date
-            )
-        ).order_by(asc(AirQualityReading.reading_time))
+        conditions = and_(
+            radius_condition(request.latitude, request.longitude, HISTORICAL_RADIUS, db.bind.dialect.name),
+            AirQualityReading.reading_time >= request.start_date,
+            AirQualityReading.reading_time <= request.end_date
+        )
         
-        result = await db.execute(readings_query)
-        readings = result.scalars().all()
+        # Statistics over the whole period, computed by the database
+        statistics = await calculate_statistics(db, conditions)
         
-        if not readings:
+        if not statistics.get("count"):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No historical data found for the specified location and time period"
             )
         
-        # Aggregate data based on requested timeframe
-        if aggregation == "daily":
-            aggregated_data = aggregate_daily_data(readings)
-        elif aggregation == "weekly":
-            aggregated_data = aggregate_weekly_data(readings)
-        else:
-            aggregated_data = readings
+        # Aggregate readings into hourly/daily/weekly buckets in SQL
+        bucket = func.date_trunc(
+            literal_column(f"'{AGGREGATION_BUCKETS[aggregation]}'"), AirQualityReading.reading_time
+        ).label("timestamp")
+        points_query = select(
+            bucket,
+            func.count().label("count"),
+            func.avg(AirQualityReading.aqi).cast(Float).label("aqi_avg"),
+            func.min(AirQualityReading.aqi).label("aqi_min"),
+            func.max(AirQualityReading.aqi).label("aqi_max"),
+            func.percentile_cont(0.5).within_group(AirQualityReading.aqi.asc()).label("aqi_median"),
+            func.avg(AirQualityReading.pm25).label("pm25_avg"),
+            func.avg(AirQualityReading.pm10).label("pm10_avg")
+        ).where(conditions).group_by(bucket).order_by(bucket)
         
-        # Calculate statistics
-        statistics = calculate_statistics(readings)
+        async def stream_lines():
+            yield orjson.dumps({
+                "location": {"latitude": request.latitude, "longitude": request.longitude},
+                "period": {"start": request.start_date, "end": request.end_date},
+                "statistics": statistics
+            }) + b"\n"
+            try:
+                result = await db.stream(points_query)
+                async for row in result.mappings():
+                    yield orjson.dumps(dict(row)) + b"\n"
+            except Exception as e:
+                logger.error(f"Error streaming historical data: {e}")
+                raise
         
-        return HistoricalDataResponse(
-            location={"latitude": request.latitude, "longitude": request.longitude},
-            period={"start": request.start_date, "end": request.end_date},
-            data_points=[AirQualityReadingSchema.from_orm(r) for r in aggregated_data],
-            statistics=statistics
-        )
+        return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
         
     except HTTPException:
         raise
@@ -491,6 +908,7 @@ async def calculate_aqi_endpoint(request: AQICalculationRequest):
 
 @router.get("/sensors/nearby", response_model=NearbySensorsResponse)
 async def get_nearby_sensors(
+    background_tasks: BackgroundTasks,
     latitude: float = Query(..., ge=-90, le=90),
     longitude: float = Query(..., ge=-180, le=180),
     radius: float = Query(default=5000, ge=100, le=50000),
@@ -499,43 +917,68 @@ async def get_nearby_sensors(
 ):
     """Get nearby sensor devices and their latest readings"""
     try:
-        # Get sensors within radius
+        # Narrow the candidates with the geo index when it's available; positions there can lag
+        # a sensor's latest reading, so the exact distance check below still applies
+        indexed_ids = await cache_service.geo_search(SENSOR_GEO_KEY, latitude, longitude, radius)
+        
+        # Get active sensors; their position is taken from their latest reading
         sensors_query = select(SensorDevice).where(
             and_(
                 SensorDevice.is_active == True,
                 SensorDevice.is_connected == True
             )
-        ).limit(limit)
+        )
+        if indexed_ids is not None:
+            sensors_query = sensors_query.where(SensorDevice.id.in_([UUID(i) for i in indexed_ids]))
         
-        result = await db.execute(sensors_query)
-        sensors = result.scalars().all()
+        sensors = {}
+        if indexed_ids is None or indexed_ids:
+            result = await db.execute(sensors_query)
+            sensors = {sensor.id: sensor for sensor in result.scalars().all()}
         
-        # Filter sensors by distance and get their latest readings
-        nearby_sensors = []
         readings = []
-        
-        for sensor in sensors:
-            # This would require more complex location storage for sensors
-            # For now, we'll return all active sensors
-            nearby_sensors.append(sensor)
-            
-            # Get latest reading from this sensor
-            reading_query = select(AirQualityReading).where(
-                AirQualityReading.sensor_id == sensor.id
-            ).order_by(desc(AirQualityReading.reading_time)).limit(1)
+        if sensors:
+            # Latest reading per sensor in a single query
+            latest_times = select(
+                AirQualityReading.sensor_id,
+                func.max(AirQualityReading.reading_time).label("latest_time")
+            ).where(
+                AirQualityReading.sensor_id.in_(sensors.keys())
+            ).group_by(AirQualityReading.sensor_id).subquery()
             
+            reading_query = select(*READING_COLUMNS).join(
+                latest_times,
+                and_(
+                    AirQualityReading.sensor_id == latest_times.c.sensor_id,
+                    AirQualityReading.reading_time == latest_times.c.latest_time
+                )
+            )
             reading_result = await db.execute(reading_query)
-            latest_reading = reading_result.scalar_one_or_none()
+            readings = list({r.sensor_id: r for r in reading_result.all()}.values())
             
-            if latest_reading:
-                readings.append(latest_reading)
-        
-        return NearbySensorsResponse(
-            location={"latitude": latitude, "longitude": longitude},
-            radius=radius,
-            sensors_found=len(nearby_sensors),
-            readings=[AirQualityReadingSchema.from_orm(r) for r in readings],
-            sensor_summary=[
+            if indexed_ids is None:
+                # Scanned every sensor; (re)build the index from their latest positions
+                background_tasks.add_task(cache_service.geo_add, SENSOR_GEO_KEY, latest_sensor_positions(readings))
+        
+        # Filter sensors by great-circle distance
+        nearby_sensors = []
+        if readings:
+            distances = distances_from(
+                latitude, longitude,
+                [r.latitude for r in readings],
+                [r.longitude for r in readings]
+            )
+            in_range = np.where(distances <= radius)[0]
+            in_range = in_range[np.argsort(distances[in_range], kind="stable")][:limit]
+            readings = [readings[i] for i in in_range]
+            nearby_sensors = [sensors[r.sensor_id] for r in readings]
+        
+        return ORJSONResponse({
+            "location": {"latitude": latitude, "longitude": longitude},
+            "radius": radius,
+            "sensors_found": len(nearby_sensors),
+            "readings": [reading_to_dict(r) for r in readings],
+            "sensor_summary": [
                 SensorReadingResponse(
                     sensor_id=sensor.id,
                     latest_reading=None,  # Would need to map from readings
@@ -544,7 +987,7 @@ async def get_nearby_sensors(
                     battery_level=sensor.battery_level
                 ) for sensor in nearby_sensors
             ]
-        )
+        })
         
     except Exception as e:
         logger.error(f"Error fetching nearby sensors: {e}")
@@ -561,22 +1004,21 @@ async def calibrate_sensor(
 ):
     """Calibrate a sensor device with reference measurements"""
     try:
-        # Get the reading and sensor
-        reading_result = await db.execute(
-            select(AirQualityReading).where(AirQualityReading.id == request.reading_id)
+        # Get the reading and sensor in one round trip; the sensor side is NULL if it doesn't exist
+        result = await db.execute(
+            select(AirQualityReading, SensorDevice)
+            .outerjoin(SensorDevice, SensorDevice.id == request.sensor_id)
+            .where(AirQualityReading.id == request.reading_id)
         )
-        reading = reading_result.scalar_one_or_none()
+        row = result.first()
         
-        if not reading:
+        if not row:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Reading not found"
             )
         
-        sensor_result = await db.execute(
-            select(SensorDevice).where(SensorDevice.id == request.sensor_id)
-        )
-        sensor = sensor_result.scalar_one_or_none()
+        reading, sensor = row
         
         if not sensor:
             raise HTTPException(
@@ -614,8 +1056,7 @@ async def calibrate_sensor(
         reading.aqi = aqi
         reading.aqi_category = category.value if category else None
         
-        db.add(sensor)
-        db.add(reading)
+        # Both objects are tracked by the session; one commit flushes them
         await db.commit()
         
         # Determine calibration quality
@@ -649,77 +1090,92 @@ async def calibrate_sensor(
         )
 
 # Helper functions
+# Health advice per AQI band (<=50, <=100, <=150, <=200, <=300, above), built once at import
+_BAND_EDGES = AQI_CATEGORY_THRESHOLDS
+_BAND_TABLE = (
+    {
+        "general": "Air quality is satisfactory for most people.",
+        "sensitive": "No precautions needed for sensitive groups.",
+        "activities": "All outdoor activities are safe.",
+        "sensitive_groups_advice": "Sensitive groups can participate in outdoor activities as normal.",
+        "general_population_advice": "Normal outdoor activities are safe for most people."
+    },
+    {
+        "general": "Air quality is acceptable for most people.",
+        "sensitive": "Unusually sensitive people should consider reducing prolonged outdoor exertion.",
+        "activities": "Normal outdoor activities are safe for most people.",
+        "sensitive_groups_advice": "Sensitive groups should consider reducing prolonged outdoor exertion.",
+        "general_population_advice": "Normal outdoor activities are safe for most people."
+    },
+    {
+        "general": "Members of sensitive groups may experience health effects.",
+        "sensitive": "Sensitive groups should limit prolonged outdoor exertion.",
+        "activities": "Consider reducing prolonged or heavy exertion outdoors.",
+        "sensitive_groups_advice": "Sensitive groups should limit prolonged outdoor exertion.",
+        "general_population_advice": "Unusually sensitive people should consider reducing outdoor activities."
+    },
+    {
+        "general": "Everyone may begin to experience health effects.",
+        "sensitive": "Sensitive groups should avoid outdoor exertion.",
+        "activities": "Reduce or reschedule strenuous outdoor activities.",
+        "sensitive_groups_advice": "Sensitive groups should avoid outdoor exertion.",
+        "general_population_advice": "Limit outdoor activities, especially for prolonged periods."
+    },
+    {
+        "general": "Health alert: everyone may experience serious effects.",
+        "sensitive": "Sensitive groups should remain indoors and avoid outdoor activities.",
+        "activities": "Avoid all outdoor strenuous activities.",
+        "sensitive_groups_advice": "Sensitive groups should remain indoors and avoid outdoor activities.",
+        "general_population_advice": "Reduce or reschedule outdoor activities."
+    },
+    {
+        "general": "Health warnings of emergency conditions.",
+        "sensitive": "All sensitive groups should remain indoors and avoid all outdoor activities.",
+        "activities": "Avoid all outdoor activities. Stay indoors with air filtration if possible.",
+        "sensitive_groups_advice": "All sensitive groups should remain indoors and avoid all outdoor activities.",
+        "general_population_advice": "Avoid all outdoor activities. Stay indoors with air filtration if possible."
+    },
+)
+
 def get_health_recommendation(aqi: int) -> str:
     """Get general health recommendation based on AQI"""
-    if aqi <= 50:
-        return "Air quality is satisfactory for most people."
-    elif aqi <= 100:
-        return "Air quality is acceptable for most people."
-    elif aqi <= 150:
-        return "Members of sensitive groups may experience health effects."
-    elif aqi <= 200:
-        return "Everyone may begin to experience health effects."
-    elif aqi <= 300:
-        return "Health alert: everyone may experience serious effects."
-    else:
-        return "Health warnings of emergency conditions."
+    return _BAND_TABLE[bisect_left(_BAND_EDGES, aqi)]["general"]
 
 def get_sensitive_groups_advice(aqi: int) -> str:
     """Get advice for sensitive groups"""
-    if aqi <= 50:
-        return "Sensitive groups can participate in outdoor activities as normal."
-    elif aqi <= 100:
-        return "Sensitive groups should consider reducing prolonged outdoor exertion."
-    elif aqi <= 150:
-        return "Sensitive groups should limit prolonged outdoor exertion."
-    elif aqi <= 200:
-        return "Sensitive groups should avoid outdoor exertion."
-    elif aqi <= 300:
-        return "Sensitive groups should remain indoors and avoid outdoor activities."
-    else:
-        return "All sensitive groups should remain indoors and avoid all outdoor activities."
+    return _BAND_TABLE[bisect_left(_BAND_EDGES, aqi)]["sensitive_groups_advice"]
 
 def get_general_population_advice(aqi: int) -> str:
     """Get advice for general population"""
-    if aqi <= 100:
-        return "Normal outdoor activities are safe for most people."
-    elif aqi <= 150:
-        return "Unusually sensitive people should consider reducing outdoor activities."
-    elif aqi <= 200:
-        return "Limit outdoor activities, especially for prolonged periods."
-    elif aqi <= 300:
-        return "Reduce or reschedule outdoor activities."
-    else:
-        return "Avoid all outdoor activities. Stay indoors with air filtration if possible."
+    return _BAND_TABLE[bisect_left(_BAND_EDGES, aqi)]["general_population_advice"]
 
 def determine_primary_pollutant(reading: AirQualityReading) -> Optional[str]:
     """Determine the primary pollutant based on concentrations"""
-    pollutants = {}
-    if reading.pm25:
-        pollutants["PM2.5"] = reading.pm25
-    if reading.pm10:
-        pollutants["PM10"] = reading.pm10
-    if reading.no2:
-        pollutants["NO2"] = reading.no2
-    if reading.so2:
-        pollutants["SO2"] = reading.so2
-    if reading.co:
-        pollutants["CO"] = reading.co
-    if reading.o3:
-        pollutants["O3"] = reading.o3
-    
-    if not pollutants:
-        return None
+    primary_pollutant = None
+    max_concentration = None
+    for name, concentration in (
+        ("PM2.5", reading.pm25),
+        ("PM10", reading.pm10),
+        ("NO2", reading.no2),
+        ("SO2", reading.so2),
+        ("CO", reading.co),
+        ("O3", reading.o3)
+    ):
+        # Missing and zero readings are ignored; ties keep the earlier pollutant
+        if concentration and (primary_pollutant is None or concentration > max_concentration):
+            primary_pollutant = name
+            max_concentration = concentration
     
-    return max(pollutants, key=pollutants.get)
+    return primary_pollutant
 
-def calculate_trend(aqi_values: List[int]) -> Optional[str]:
+def calculate_trend(aqi_values: np.ndarray) -> Optional[str]:
     """Calculate AQI trend (improving, worsening, stable)"""
-    if len(aqi_values) < 3:
+    # Needs at least one earlier value to compare the last three against
+    if aqi_values.size < 4:
         return None
     
-    recent_avg = sum(aqi_values[-3:]) / 3
-    earlier_avg = sum(aqi_values[:-3]) / len(aqi_values[:-3])
+    recent_avg = aqi_values[-3:].mean()
+    earlier_avg = aqi_values[:-3].mean()
     
     difference = recent_avg - earlier_avg
     if abs(difference) < 5:  # Threshold for "stable"
@@ -729,80 +1185,46 @@ def calculate_trend(aqi_values: List[int]) -> Optional[str]:
     else:
         return "worsening"
 
-def aggregate_daily_data(readings: List[AirQualityReading]) -> List[AirQualityReading]:
-    """Aggregate readings into daily averages"""
-    # This would implement daily aggregation logic
-    # For now, return all readings
-    return readings
-
-def aggregate_weekly_data(readings: List[AirQualityReading]) -> List[AirQualityReading]:
-    """Aggregate readings into weekly averages"""
-    # This would implement weekly aggregation logic
-    # For now, return all readings
-    return readings
-
-def calculate_statistics(readings: List[AirQualityReading]) -> Dict[str, Any]:
-    """Calculate statistical summaries of readings"""
-    if not readings:
-        return {}
+async def calculate_statistics(db: AsyncSession, conditions) -> Dict[str, Any]:
+    """Calculate statistical summaries of the readings matching ``conditions`` in one query"""
+    stats_query = select(
+        func.count().label("count"),
+        func.min(AirQualityReading.aqi).label("aqi_min"),
+        func.max(AirQualityReading.aqi).label("aqi_max"),
+        func.avg(AirQualityReading.aqi).label("aqi_avg"),
+        func.percentile_cont(0.5).within_group(AirQualityReading.aqi.asc()).label("aqi_median"),
+        func.avg(AirQualityReading.pm25).label("pm25_avg"),
+        func.min(AirQualityReading.reading_time).label("start"),
+        func.max(AirQualityReading.reading_time).label("end")
+    ).where(conditions)
     
-    aqi_values = [r.aqi for r in readings if r.aqi is not None]
-    pm25_values = [r.pm25 for r in readings if r.pm25 is not None]
+    row = (await db.execute(stats_query)).one()
     
-    if not aqi_values:
-        return {}
+    if row.aqi_min is None:
+        return {"count": row.count}
     
     return {
-        "count": len(readings),
-        "aqi_min": min(aqi_values),
-        "aqi_max": max(aqi_values),
-        "aqi_avg": sum(aqi_values) / len(aqi_values),
-        "aqi_median": sorted(aqi_values)[len(aqi_values) // 2],
-        "pm25_avg": sum(pm25_values) / len(pm25_values) if pm25_values else None,
+        "count": row.count,
+        "aqi_min": row.aqi_min,
+        "aqi_max": row.aqi_max,
+        "aqi_avg": float(row.aqi_avg),
+        "aqi_median": row.aqi_median,
+        "pm25_avg": float(row.pm25_avg) if row.pm25_avg is not None else None,
         "date_range": {
-            "start": min(r.reading_time for r in readings),
-            "end": max(r.reading_time for r in readings)
+            "start": row.start,
+            "end": row.end
         }
     }
 
+# Detailed recommendations per AQI band, built once; shared between calls, so never mutate them
+_BAND_RECOMMENDATIONS = tuple(
+    {"general": band["general"], "sensitive": band["sensitive"], "activities": band["activities"]}
+    for band in _BAND_TABLE
+)
+
 def get_health_recommendations(aqi: int) -> Dict[str, str]:
     """Get detailed health recommendations"""
-    if aqi <= 50:
-        return {
-            "general": "Air quality is satisfactory for most people.",
-            "sensitive": "No precautions needed for sensitive groups.",
-            "activities": "All outdoor activities are safe."
-        }
-    elif aqi <= 100:
-        return {
-            "general": "Air quality is acceptable for most people.",
-            "sensitive": "Unusually sensitive people should consider reducing prolonged outdoor exertion.",
-            "activities": "Normal outdoor activities are safe for most people."
-        }
-    elif aqi <= 150:
-        return {
-            "general": "Members of sensitive groups may experience health effects.",
-            "sensitive": "Sensitive groups should limit prolonged outdoor exertion.",
-            "activities": "Consider reducing prolonged or heavy exertion outdoors."
-        }
-    elif aqi <= 200:
-        return {
-            "general": "Everyone may begin to experience health effects.",
-            "sensitive": "Sensitive groups should avoid outdoor exertion.",
-            "activities": "Reduce or reschedule strenuous outdoor activities."
-        }
-    elif aqi <= 300:
-        return {
-            "general": "Health alert: everyone may experience serious effects.",
-            "sensitive": "Sensitive groups should remain indoors and avoid outdoor activities.",
-            "activities": "Avoid all outdoor strenuous activities."
-        }
-    else:
-        return {
-            "general": "Health warnings of emergency conditions.",
-            "sensitive": "All sensitive groups should remain indoors and avoid all outdoor activities.",
-            "activities": "Avoid all outdoor activities. Stay indoors with air filtration if possible."
-        }
+    return _BAND_RECOMMENDATIONS[bisect_left(_BAND_EDGES, aqi)]
 
 def calculate_aqi_breakdown(request: AQICalculationRequest) -> Dict[str, Any]:
     """Calculate detailed AQI breakdown by pollutant"""
@@ -1,30 +1,128 @@
 from datetime import datetime, timedelta
+import copy
+import hashlib
+import hmac
+import logging
+import re
+import threading
+import time
+import uuid
 from typing import Optional, List
+import anyio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cachetools import TTLCache
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import bindparam, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
 
 from app.core.config import settings
-from app.models import UserProfile
+from app.models import UserProfile, SUBSCRIPTION_TIER_LEVELS
 from app.core.database import get_database
+from app.core.rate_limit import rate_limiter, FEATURE_LIMIT_KEYS
+
+logger = logging.getLogger(__name__)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Hashing for machine-generated secrets (API keys, refresh/bearer secrets). bcrypt's cost
+# doubles per round (2^cost, ~80 ms at the default 12) to slow guessing of low-entropy user
+# passwords; high-entropy random tokens can't be brute forced either way, so a cheap argon2id
+# setting is enough here. Never use this context for user passwords.
+token_context = CryptContext(
+    schemes=["argon2"],
+    argon2__type="ID",
+    argon2__time_cost=1,
+    argon2__memory_cost=8192,
+    argon2__parallelism=1
+)
+
+# Recent password verification results (positive and negative), keyed by an HMAC of the
+# password/hash pair so no plaintext is held; production keeps entries for at most a minute
+_password_cache = TTLCache(
+    maxsize=4096,
+    ttl=min(settings.VERIFY_PASSWORD_CACHE_TTL, 60)
+    if settings.ENVIRONMENT == "production" else settings.VERIFY_PASSWORD_CACHE_TTL
+)
+_password_cache_lock = threading.Lock()
+
+# Decoded payloads of recently verified tokens, keyed by the token's SHA-256 digest
+_token_cache = TTLCache(
+    maxsize=10000,
+    ttl=min(settings.JWT_CACHE_TTL, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+)
+_token_cache_lock = threading.Lock()
+
+# Column values of recently authenticated users, keyed by user id. Each request rebuilds its
+# own instance from these so no ORM state is shared between sessions. Nothing in the API
+# changes a user's tier or active flag, so entries simply age out after USER_CACHE_TTL.
+_user_cache = TTLCache(maxsize=5000, ttl=settings.USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+_USER_COLUMNS = tuple(attr.key for attr in inspect(UserProfile).column_attrs)
+
+# User lookup built once at import; every call reuses its cached compilation (and, with
+# asyncpg's statement cache, the server-side prepared statement)
+_USER_BY_ID_STMT = select(UserProfile).where(UserProfile.id == bindparam("user_id"))
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
+# Shape of a bcrypt hash: $2a$/$2b$/$2y$, two-digit cost, then 53 chars of salt and digest
+_BCRYPT_HASH_RE = re.compile(r"\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}")
+
+def is_plausible_password_hash(hashed_password: Optional[str]) -> bool:
+    """Cheap structural check so malformed hashes never reach a full bcrypt round"""
+    return (
+        isinstance(hashed_password, str)
+        and len(hashed_password) == 60
+        and _BCRYPT_HASH_RE.fullmatch(hashed_password) is not None
+        and pwd_context.identify(hashed_password) is not None
+    )
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    if not is_plausible_password_hash(hashed_password):
+        return False
+    
+    if not settings.USE_VERIFY_PASSWORD_CACHE:
+        return pwd_context.verify(plain_password, hashed_password)
+    
+    key = hmac.new(
+        settings.SECRET_KEY.encode(),
+        plain_password.encode() + b"\0" + hashed_password.encode(),
+        hashlib.sha256
+    ).digest()
+    with _password_cache_lock:
+        verified = _password_cache.get(key)
+    if verified is None:
+        verified = pwd_context.verify(plain_password, hashed_password)
+        with _password_cache_lock:
+            _password_cache[key] = verified
+    return verified
 
 def get_password_hash(password: str) -> str:
     """Generate password hash"""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on a worker thread so bcrypt doesn't block the event loop"""
+    return await anyio.to_thread.run_sync(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on a worker thread so bcrypt doesn't block the event loop"""
+    return await anyio.to_thread.run_sync(get_password_hash, password)
+
+def get_token_hash(token: str) -> str:
+    """Hash a machine-generated secret for storage"""
+    return token_context.hash(token)
+
+def verify_token_hash(token: str, hashed_token: str) -> bool:
+    """Verify a machine-generated secret against its stored hash"""
+    return token_context.verify(token, hashed_token)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -37,16 +135,56 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[dict]:
-    """Verify JWT token"""
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
+class InvalidTokenError(Exception):
+    """Raised when a bearer token fails verification"""
+
+def verify_token(token: str) -> dict:
+    """
+    Verify JWT token, reusing the decoded payload of recently verified tokens.
+    The payload is guaranteed to carry "exp" and "sub"; raises InvalidTokenError otherwise.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is not None and payload["exp"] > time.time():
         return payload
-    except JWTError:
+    
+    try:
+        payload = jwt.decode(
+            token,
+            settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM],
+            options={"require_exp": True, "require_sub": True}
+        )
+    except JWTError as e:
+        raise InvalidTokenError(str(e)) from e
+    
+    # Only successfully verified tokens are cached
+    with _token_cache_lock:
+        _token_cache[key] = payload
+    return payload
+
+async def load_user(db: AsyncSession, user_id: str) -> Optional[UserProfile]:
+    """Load a user into ``db``, from the short-lived user cache when possible"""
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
         return None
+    
+    with _user_cache_lock:
+        values = _user_cache.get(user_id)
+    
+    if values is not None:
+        user = UserProfile(**copy.deepcopy(values))
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+    
+    result = await db.execute(_USER_BY_ID_STMT, {"user_id": user_id})
+    user = result.scalar_one_or_none()
+    if user is not None:
+        with _user_cache_lock:
+            _user_cache[user_id] = {key: getattr(user, key) for key in _USER_COLUMNS}
+    return user
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -61,19 +199,10 @@ async def get_current_user(
     
     try:
         payload = verify_token(token)
-        if payload is None:
-            raise credentials_exception
-        
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-            
-    except JWTError:
+    except InvalidTokenError:
         raise credentials_exception
     
-    # Get user from database
-    result = await db.execute(select(UserProfile).where(UserProfile.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await load_user(db, payload["sub"])
     
     if user is None:
         raise credentials_exception
@@ -86,11 +215,8 @@ async def get_current_user(
     
     return user
 
-async def get_current_active_user(current_user: UserProfile = Depends(get_current_user)) -> UserProfile:
-    """Get current active user"""
-    if not current_user.is_active:
-        raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
+# get_current_user already rejects inactive users; kept as an alias for existing imports
+get_current_active_user = get_current_user
 
 async def get_optional_user(
     token: str = Depends(oauth2_scheme),
@@ -99,15 +225,7 @@ async def get_optional_user(
     """Get current user if authenticated, return None otherwise"""
     try:
         payload = verify_token(token)
-        if payload is None:
-            return None
-        
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-            
-        result = await db.execute(select(UserProfile).where(UserProfile.id == user_id))
-        user = result.scalar_one_or_none()
+        user = await load_user(db, payload["sub"])
         
         if user is None or not user.is_active:
             return None
@@ -118,12 +236,10 @@ async def get_optional_user(
 
 def require_subscription(required_tier: str = "free"):
     """Decorator to require specific subscription tier"""
-    def subscription_checker(current_user: UserProfile = Depends(get_current_active_user)):
-        tier_hierarchy = {"free": 0, "pro": 1, "enterprise": 2}
-        user_tier_level = tier_hierarchy.get(current_user.subscription_tier, 0)
-        required_tier_level = tier_hierarchy.get(required_tier, 0)
-        
-        if user_tier_level < required_tier_level:
+    required_level = SUBSCRIPTION_TIER_LEVELS[required_tier]
+    
+    def subscription_checker(current_user: UserProfile = Depends(get_current_user)):
+        if current_user.subscription_tier_level < required_level:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"This feature requires {required_tier} subscription or higher"
@@ -132,15 +248,11 @@ def require_subscription(required_tier: str = "free"):
     
     return subscription_checker
 
-def check_rate_limit(user: UserProfile, feature: str) -> bool:
-    """Check if user has exceeded rate limits"""
-    # Reset daily counters if needed
-    now = datetime.utcnow()
-    if (now - user.last_query_reset).days >= 1:
-        user.daily_queries_count = 0
-        user.daily_photos_count = 0
-        user.daily_predictions_count = 0
-        user.last_query_reset = now
+async def check_rate_limit(user: UserProfile, feature: str) -> bool:
+    """Count one use of a feature and check the user's daily limit"""
+    limit_key = FEATURE_LIMIT_KEYS.get(feature)
+    if limit_key is None:
+        return True
     
     # Check limits based on subscription tier
     if user.subscription_tier == "free":
@@ -148,21 +260,8 @@ def check_rate_limit(user: UserProfile, feature: str) -> bool:
     else:
         limits = settings.PRO_TIER_LIMITS
     
-    # Check specific feature limits
-    if feature == "query" and user.daily_queries_count >= limits["daily_queries"]:
-        return False
-    elif feature == "photo" and user.daily_photos_count >= limits["photo_uploads"]:
-        return False
-    elif feature == "prediction" and user.daily_predictions_count >= limits["predictions"]:
-        return False
-    
-    return True
+    return await rate_limiter.consume(user.id, feature, getattr(limits, limit_key))
 
-def increment_usage_count(user: UserProfile, feature: str):
-    """Increment user's usage count"""
-    if feature == "query":
-        user.daily_queries_count += 1
-    elif feature == "photo":
-        user.daily_photos_count += 1
-    elif feature == "prediction":
-        user.daily_predictions_count += 1
\ No newline at end of file
+async def increment_usage_count(user: UserProfile, feature: str):
+    """Increment user's usage count without enforcing the limit (safe to run as a background task)"""
+    await check_rate_limit(user, feature)
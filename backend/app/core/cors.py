@@ -0,0 +1,76 @@
+from typing import Any, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.cors import CORSMiddleware as BaseCORSMiddleware
+from starlette.types import Message, Receive, Scope, Send
+
+
+class CORSMiddleware(BaseCORSMiddleware):
+    """
+    CORSMiddleware with the origin list frozen into a set and the simple-response
+    headers encoded once. Requests are checked against the raw ASGI headers, so
+    ones without an Origin header pass straight through; preflights are answered
+    by the base class.
+    """
+
+    def __init__(self, app: Any, allow_origins: Sequence[str] = (), **kwargs: Any) -> None:
+        super().__init__(app, allow_origins=allow_origins, **kwargs)
+        self.allow_origins = frozenset(allow_origins)
+        self._raw_headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in self.simple_headers.items()
+        ]
+        # For responses that mirror the request's origin instead of "*"
+        self._raw_headers_no_origin = [
+            header for header in self._raw_headers if header[0] != b"access-control-allow-origin"
+        ]
+        # Headers the app already set under the names being added are replaced, as the base class does
+        self._raw_header_names = frozenset(name for name, _ in self._raw_headers)
+        self._raw_header_names_with_origin = self._raw_header_names | {b"access-control-allow-origin"}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        has_cookie = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"cookie":
+                has_cookie = True
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            headers = Headers(scope=scope)
+            if "access-control-request-method" in headers:
+                response = self.preflight_response(request_headers=headers)
+                await response(scope, receive, send)
+                return
+
+        # Requests with cookies get the specific origin rather than "*"
+        if (self.allow_all_origins and has_cookie) or (
+            not self.allow_all_origins and self.is_allowed_origin(origin.decode("latin-1"))
+        ):
+            cors_headers = [*self._raw_headers_no_origin, (b"access-control-allow-origin", origin)]
+            replaced = self._raw_header_names_with_origin
+            vary = True
+        else:
+            cors_headers = self._raw_headers
+            replaced = self._raw_header_names
+            vary = False
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    header for header in message.get("headers", ()) if header[0] not in replaced
+                ] + cors_headers
+                if vary:
+                    MutableHeaders(scope=message).add_vary_header("Origin")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
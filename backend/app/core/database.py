@@ -1,27 +1,46 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import StaticPool
 from sqlalchemy import text
+from datetime import datetime
 import logging
 
+import orjson
+
 from app.core.config import settings
 from app.models import Base
 
 logger = logging.getLogger(__name__)
 
+def _json_serializer(value) -> str:
+    """orjson-backed JSON/JSONB column serializer (drivers expect text)"""
+    return orjson.dumps(value).decode()
+
 # Create async engine
 if settings.ENVIRONMENT == "test":
     engine = create_async_engine(
         settings.DATABASE_URL_TEST,
         echo=False,
         poolclass=StaticPool,
+        json_serializer=_json_serializer,
+        json_deserializer=orjson.loads,
     )
 else:
     engine = create_async_engine(
         settings.DATABASE_URL,
         echo=settings.DEBUG,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_POOL_OVERFLOW,
         pool_pre_ping=True,
-        pool_recycle=300,
+        pool_recycle=settings.DB_POOL_RECYCLE,
         future=True,
+        json_serializer=_json_serializer,
+        json_deserializer=orjson.loads,
+        connect_args={
+            # Short OLTP queries never benefit from JIT compilation
+            "server_settings": {"jit": "off"},
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
     )
 
 # Create async session factory
@@ -29,6 +48,7 @@ AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
+    autoflush=False,
 )
 
 async def get_database() -> AsyncSession:
@@ -39,10 +59,116 @@ async def get_database() -> AsyncSession:
         finally:
             await session.close()
 
+# Postgres extensions required by model indexes and radius queries
+POSTGRES_EXTENSIONS = ("cube", "earthdistance")
+
+# Indexes on tables that may predate them; create_all only builds indexes for tables it creates.
+# Columns added since are brought in once by scripts/migrate_schema.py
+POSTGRES_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_user_profiles_subscription_tier_level ON user_profiles (subscription_tier_level)",
+    "CREATE INDEX IF NOT EXISTS idx_user_email_login ON user_profiles (email) "
+    "INCLUDE (is_active, subscription_tier, subscription_tier_level)",
+    "CREATE INDEX IF NOT EXISTS idx_user_notif_prefs ON user_profiles USING gin (notification_preferences)",
+)
+
+# Monthly partitions of air_quality_readings kept ahead of the current month
+READING_PARTITIONS_AHEAD = 2
+
+def _add_months(month: datetime, months: int) -> datetime:
+    """First day of the month ``months`` after ``month``"""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def reading_partition_name(month: datetime) -> str:
+    """Name of the air_quality_readings partition holding ``month``"""
+    return f"air_quality_readings_y{month.year}m{month.month:02d}"
+
+async def is_partitioned(conn, table: str) -> bool:
+    """Whether ``table`` was created as a partitioned table"""
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    )
+    return result.scalar() == "p"
+
+async def create_reading_partitions(conn, months_ahead: int = READING_PARTITIONS_AHEAD) -> int:
+    """Create the default partition and monthly partitions through ``months_ahead``; returns the count checked"""
+    if not await is_partitioned(conn, "air_quality_readings"):
+        logger.warning("air_quality_readings is not partitioned; recreate it to enable monthly partitions")
+        return 0
+    
+    # Catches readings outside the prepared months (e.g. backfilled history)
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS air_quality_readings_default PARTITION OF air_quality_readings DEFAULT"
+    ))
+    
+    current_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(months_ahead + 1):
+        await create_reading_partition(conn, _add_months(current_month, offset))
+    return months_ahead + 1
+
+async def create_reading_partition(conn, month: datetime):
+    """Create the partition for ``month`` unless it exists, taking over its rows from the default partition"""
+    name = reading_partition_name(month)
+    result = await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+    if result.scalar():
+        return
+    
+    # A partition can't be added while the default partition holds rows in its range (say from
+    # a sensor with a bad clock), so the table is built standalone, the rows moved, then attached
+    start, end = f"{month:%Y-%m-%d}", f"{_add_months(month, 1):%Y-%m-%d}"
+    await conn.execute(text(
+        f"CREATE TABLE {name} (LIKE air_quality_readings INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM air_quality_readings_default "
+        f"WHERE reading_time >= '{start}' AND reading_time < '{end}' RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await conn.execute(text(
+        f"ALTER TABLE air_quality_readings ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+
+async def drop_reading_partitions_before(conn, cutoff: datetime) -> int:
+    """Drop monthly partitions whose whole range is older than ``cutoff``; returns the number dropped"""
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'air_quality_readings'"
+    ))
+    
+    dropped = 0
+    for name in result.scalars().all():
+        try:
+            month = datetime.strptime(name, "air_quality_readings_y%Ym%m")
+        except ValueError:
+            continue  # default partition
+        if _add_months(month, 1) <= cutoff:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped += 1
+    return dropped
+
+async def prune_default_reading_partition(conn, cutoff: datetime) -> int:
+    """Delete rows older than ``cutoff`` from the default partition; returns the number deleted"""
+    result = await conn.execute(text("SELECT to_regclass('air_quality_readings_default') IS NOT NULL"))
+    if not result.scalar():
+        return 0
+    result = await conn.execute(
+        text("DELETE FROM air_quality_readings_default WHERE reading_time < :cutoff"), {"cutoff": cutoff}
+    )
+    return result.rowcount
+
 async def create_tables():
-    """Create all tables"""
+    """Create required extensions and all tables"""
     async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            for extension in POSTGRES_EXTENSIONS:
+                await conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
         await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            for statement in POSTGRES_INDEXES:
+                await conn.execute(text(statement))
+            await create_reading_partitions(conn)
 
 async def drop_tables():
     """Drop all tables"""
@@ -0,0 +1,104 @@
+import math
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+EARTH_RADIUS_M = 6371000.0  # Earth's radius in meters
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _haversine_scalar(lat1, lon1, lat2, lon2):
+        """Great-circle distance in meters between two points given in radians"""
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = math.sin(dlat * 0.5) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon * 0.5) ** 2
+        return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    @njit(cache=True, fastmath=True)
+    def haversine_batch(lat1, lon1, lats, lons, out):
+        """Fill ``out`` with distances in meters from (lat1, lon1) to each point; all inputs in radians"""
+        cos_lat1 = math.cos(lat1)
+        for i in range(lats.shape[0]):
+            dlat = lats[i] - lat1
+            dlon = lons[i] - lon1
+            a = math.sin(dlat * 0.5) ** 2 + cos_lat1 * math.cos(lats[i]) * math.sin(dlon * 0.5) ** 2
+            out[i] = 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+else:
+    def _haversine_scalar(lat1, lon1, lat2, lon2):
+        """Great-circle distance in meters between two points given in radians"""
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = math.sin(dlat * 0.5) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon * 0.5) ** 2
+        return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    def haversine_batch(lat1, lon1, lats, lons, out):
+        """Fill ``out`` with distances in meters from (lat1, lon1) to each point; all inputs in radians"""
+        a = np.sin((lats - lat1) * 0.5) ** 2 + math.cos(lat1) * np.cos(lats) * np.sin((lons - lon1) * 0.5) ** 2
+        np.multiply(2 * EARTH_RADIUS_M, np.arctan2(np.sqrt(a), np.sqrt(1 - a)), out=out)
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters between two points given in degrees"""
+    return _haversine_scalar(math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2))
+
+
+def to_radians(values) -> np.ndarray:
+    """Contiguous float64 array of ``values`` (degrees) converted to radians"""
+    return np.radians(np.ascontiguousarray(values, dtype=np.float64))
+
+
+def distances_from_radians(latitude: float, longitude: float,
+                           lats_rad: np.ndarray, lons_rad: np.ndarray) -> np.ndarray:
+    """Distances in meters from a point (degrees) to arrays already converted with to_radians"""
+    out = np.empty(lats_rad.shape[0], dtype=np.float64)
+    haversine_batch(math.radians(latitude), math.radians(longitude), lats_rad, lons_rad, out)
+    return out
+
+
+def distances_from(latitude: float, longitude: float, lats, lons) -> np.ndarray:
+    """Distances in meters from a point to arrays of points, all given in degrees"""
+    return distances_from_radians(latitude, longitude, to_radians(lats), to_radians(lons))
+
+
+def _spread_bits(value: int) -> int:
+    """Spread the low 32 bits of ``value`` so a zero bit sits between each of them"""
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def morton_code(lat_cell: int, lon_cell: int, scale: int) -> int:
+    """
+    64-bit Z-order code of a grid cell given as lat/lon multiplied by ``scale`` and rounded.
+    Nearby cells share high bits, so the code works as a compact cache key and spatial sort key.
+    """
+    return _spread_bits(lat_cell + 90 * scale) << 1 | _spread_bits(lon_cell + 180 * scale)
+
+
+def geo_cell(latitude: float, longitude: float, scale: int) -> int:
+    """Morton code of the 1/``scale`` degree grid cell containing a point"""
+    return morton_code(round(latitude * scale), round(longitude * scale), scale)
+
+
+def _warm_up():
+    """Compile (or load from cache) the kernels so the first request isn't penalized"""
+    try:
+        haversine(0.0, 0.0, 0.0, 0.0)
+        distances_from(0.0, 0.0, np.zeros(1), np.zeros(1))
+    except Exception as e:
+        logger.error(f"Failed to warm up haversine kernels: {e}")
+
+
+_warm_up()
@@ -0,0 +1,188 @@
+import logging
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
+
+import redis.asyncio as redis
+from cachetools import TLRUCache, TTLCache
+from sqlalchemy import update, bindparam
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Tier limit key per rate-limited feature
+FEATURE_LIMIT_KEYS = {
+    "query": "daily_queries",
+    "photo": "photo_uploads",
+    "prediction": "predictions"
+}
+
+# Persisted usage counter column per feature
+FEATURE_COUNT_COLUMNS = {
+    "query": "daily_queries_count",
+    "photo": "daily_photos_count",
+    "prediction": "daily_predictions_count"
+}
+
+# executemany UPDATE writing a user's counters; users deleted since their requests simply match no row
+FLUSH_STATEMENT = (
+    update(UserProfile.__table__)
+    .where(UserProfile.__table__.c.id == bindparam("user_id"))
+    .values({
+        column: bindparam(column)
+        for column in [*FEATURE_COUNT_COLUMNS.values(), "last_query_reset", "last_query_reset_epoch_day"]
+    })
+)
+
+# INCR the day's counter, start its expiry on first use and compare against the limit in a
+# single round trip. Returns {count, over_limit}.
+CONSUME_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if count > tonumber(ARGV[1]) then
+    return {count, 1}
+end
+return {count, 0}
+"""
+
+COUNTER_TTL = 86400  # seconds
+SECONDS_PER_DAY = 86400
+
+
+def epoch_day(now: Optional[float] = None) -> int:
+    """UTC days since the Unix epoch; rate-limit periods roll over when this changes"""
+    return int((time.time() if now is None else now) // SECONDS_PER_DAY)
+
+
+@lru_cache(maxsize=4)
+def day_stamp(day: int) -> str:
+    """YYYYMMDD for an epoch day (formatted once per day, not per request)"""
+    return datetime.utcfromtimestamp(day * SECONDS_PER_DAY).strftime("%Y%m%d")
+
+
+def usage_key(user_id: uuid.UUID, feature: str, day: int) -> str:
+    """Redis key for a user's daily usage counter"""
+    return f"usage:{user_id}:{feature}:{day_stamp(day)}"
+
+
+class RateLimiter:
+    """Daily per-user feature limits counted in Redis"""
+    
+    def __init__(self):
+        self.redis_client: Optional[redis.Redis] = None
+        self._consume_script = None
+        # In-process counters when Redis is unavailable; two days covers the period rollover
+        self._memory_counts: TTLCache = TTLCache(maxsize=100000, ttl=2 * COUNTER_TTL)
+        # (user_id, feature) -> end of period; users already over a limit are refused locally
+        # until midnight without touching Redis
+        self._denied: TLRUCache = TLRUCache(maxsize=10000, ttu=lambda key, expires, now: expires, timer=time.time)
+    
+    async def initialize(self):
+        """Initialize Redis connection"""
+        try:
+            self.redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+            await self.redis_client.ping()
+            self._consume_script = self.redis_client.register_script(CONSUME_SCRIPT)
+            logger.info("Rate limiter initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize rate limiter: {e}")
+            # Fallback to in-memory counters
+            self.redis_client = None
+            self._consume_script = None
+    
+    async def shutdown(self):
+        """Flush counters and close the Redis connection"""
+        await self.flush_usage_counts()
+        if self.redis_client:
+            await self.redis_client.close()
+            logger.info("Rate limiter shutdown complete")
+    
+    async def consume(self, user_id: uuid.UUID, feature: str, limit: int) -> bool:
+        """Count one use of ``feature``; False once the user has gone over ``limit`` today"""
+        if (user_id, feature) in self._denied:
+            return False
+        
+        day = epoch_day()
+        key = usage_key(user_id, feature, day)
+        
+        try:
+            if self._consume_script:
+                count, over_limit = await self._consume_script(keys=[key], args=[limit, COUNTER_TTL])
+            else:
+                count = self._memory_counts.get(key, 0) + 1
+                self._memory_counts[key] = count
+                over_limit = count > limit
+        except Exception as e:
+            # Fail open: a Redis outage shouldn't take the API down with it
+            logger.error(f"Rate limit check failed for user {user_id}: {e}")
+            return True
+        
+        if over_limit:
+            self._denied[(user_id, feature)] = (day + 1) * SECONDS_PER_DAY
+            return False
+        
+        return True
+    
+    async def get_usage_counts(self, day: int) -> Dict[Tuple[uuid.UUID, str], int]:
+        """Current counters for epoch ``day`` keyed by (user_id, feature)"""
+        suffix = f":{day_stamp(day)}"
+        counts = {}
+        
+        if self.redis_client:
+            keys = [key async for key in self.redis_client.scan_iter(match=f"usage:*{suffix}", count=1000)]
+            values = await self.redis_client.mget(keys) if keys else []
+            items = zip(keys, values)
+        else:
+            items = list(self._memory_counts.items())
+        
+        for key, value in items:
+            if value is None or not key.endswith(suffix):
+                continue
+            _, user_id, feature, _ = key.split(":")
+            counts[(uuid.UUID(user_id), feature)] = int(value)
+        
+        return counts
+    
+    async def flush_usage_counts(self) -> int:
+        """Persist today's counters to user_profiles; returns the number of users updated"""
+        try:
+            day = epoch_day()
+            period_start = datetime.utcfromtimestamp(day * SECONDS_PER_DAY)
+            counts = await self.get_usage_counts(day)
+            
+            rows: Dict[uuid.UUID, Dict] = {}
+            for (user_id, feature), count in counts.items():
+                column = FEATURE_COUNT_COLUMNS.get(feature)
+                if column is None:
+                    continue
+                row = rows.setdefault(user_id, {
+                    "user_id": user_id,
+                    "daily_queries_count": 0,
+                    "daily_photos_count": 0,
+                    "daily_predictions_count": 0,
+                    "last_query_reset": period_start,
+                    "last_query_reset_epoch_day": day
+                })
+                row[column] = count
+            
+            if not rows:
+                return 0
+            
+            async with AsyncSessionLocal() as session:
+                await session.execute(FLUSH_STATEMENT, list(rows.values()))
+                await session.commit()
+            
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Failed to flush usage counters: {e}")
+            return 0
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,47 @@
+from typing import Any, Callable, Dict, Type, TypeVar
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def json_body(model: Type[ModelT]) -> Callable[[Request], Any]:
+    """
+    Dependency validating the raw request body straight into ``model``.
+    Pydantic parses the JSON bytes itself instead of FastAPI decoding them to
+    Python objects first; errors are reported like FastAPI's own body errors.
+    """
+    async def dependency(request: Request) -> ModelT:
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            )
+    
+    return dependency
+
+
+def _inline_refs(node: Any, defs: Dict[str, Any]) -> Any:
+    """Replace local ``$defs`` references so the schema can be embedded anywhere in the document"""
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_refs(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+        return {key: _inline_refs(value, defs) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_inline_refs(value, defs) for value in node]
+    return node
+
+
+def json_body_openapi(model: Type[BaseModel]) -> Dict[str, Any]:
+    """``openapi_extra`` documenting a body read with json_body"""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_refs(schema, defs)}}
+        }
+    }
@@ -0,0 +1,26 @@
+import uuid
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse as BaseORJSONResponse
+from pydantic import BaseModel
+
+
+def _default(value: Any) -> Any:
+    """Serialize values orjson doesn't handle natively: asyncpg's UUID subclass and Pydantic models"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError
+
+
+class ORJSONResponse(BaseORJSONResponse):
+    """ORJSONResponse that also accepts database UUIDs and Pydantic models nested in the content"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
@@ -1,20 +1,30 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, JSON, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, JSON, ForeignKey, Index, Uuid
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from datetime import datetime
+import time
 import uuid
 
 Base = declarative_base()
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    return uuid.uuid4()
+
+# JSON documents are stored as binary JSONB on Postgres (parsed once on write, GIN-indexable)
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+# Numeric rank of each subscription tier; higher tiers include the lower ones
+SUBSCRIPTION_TIER_LEVELS = {"free": 0, "pro": 1, "enterprise": 2}
 
 class AirQualityReading(Base):
     """Air quality reading model"""
     __tablename__ = "air_quality_readings"
+    # Monthly range partitions on Postgres (see app.core.database.create_reading_partitions)
+    __table_args__ = {"postgresql_partition_by": "RANGE (reading_time)"}
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     
@@ -33,11 +43,11 @@ class AirQualityReading(Base):
     
     # Metadata
     source = Column(String, default="mobile")  # mobile, sensor, api
-    sensor_id = Column(String, nullable=True)
-    user_id = Column(String, nullable=True)
+    sensor_id = Column(Uuid(as_uuid=True), nullable=True)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("user_profiles.id"), nullable=True)
     
-    # Timestamps
-    reading_time = Column(DateTime, nullable=False)
+    # Timestamps; reading_time is the partition key, so it is part of the primary key
+    reading_time = Column(DateTime, primary_key=True, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
@@ -67,7 +77,7 @@ class UserProfile(Base):
     """User profile model"""
     __tablename__ = "user_profiles"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
     email = Column(String, unique=True, nullable=False, index=True)
     username = Column(String, unique=True, nullable=True)
     
@@ -91,12 +101,13 @@ class UserProfile(Base):
     exercise_frequency = Column(String, nullable=True)  # daily, weekly, monthly, rarely
     
     # Preferences
-    notification_preferences = Column(JSON, default={})
+    notification_preferences = Column(JSONDocument, default={})
     unit_preference = Column(String, default="metric")  # metric, imperial
     language = Column(String, default="en")
     
     # Subscription
     subscription_tier = Column(String, default="free")  # free, pro, enterprise
+    subscription_tier_level = Column(Integer, default=0, index=True)  # SUBSCRIPTION_TIER_LEVELS[subscription_tier]
     subscription_expires_at = Column(DateTime, nullable=True)
     
     # Usage tracking
@@ -104,6 +115,7 @@ class UserProfile(Base):
     daily_photos_count = Column(Integer, default=0)
     daily_predictions_count = Column(Integer, default=0)
     last_query_reset = Column(DateTime, default=func.now())
+    last_query_reset_epoch_day = Column(Integer, default=lambda: int(time.time() // 86400))  # UTC day of the counters
     
     # Timestamps
     created_at = Column(DateTime, server_default=func.now())
@@ -115,12 +127,18 @@ class UserProfile(Base):
     # Relationships
     readings = relationship("AirQualityReading", backref="user")
     predictions = relationship("PredictionData", backref="user")
+    
+    @validates("subscription_tier")
+    def _sync_subscription_tier_level(self, key, tier):
+        """Keep the denormalized tier level in step with the tier name"""
+        self.subscription_tier_level = SUBSCRIPTION_TIER_LEVELS.get(tier, 0)
+        return tier
 
 class PredictionData(Base):
     """Pollution prediction model"""
     __tablename__ = "prediction_data"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
     
     # Location
     latitude = Column(Float, nullable=False, index=True)
@@ -139,12 +157,12 @@ class PredictionData(Base):
     model_type = Column(String, nullable=True)  # lstm, xgboost, ensemble
     
     # Input features used for prediction
-    weather_data = Column(JSON, nullable=True)
-    traffic_data = Column(JSON, nullable=True)
-    historical_data = Column(JSON, nullable=True)
+    weather_data = Column(JSONDocument, nullable=True)
+    traffic_data = Column(JSONDocument, nullable=True)
+    historical_data = Column(JSONDocument, nullable=True)
     
     # User context
-    user_id = Column(String, nullable=True)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("user_profiles.id"), nullable=True)
     zone_id = Column(String, nullable=True)
     
     # Timestamps
@@ -159,8 +177,8 @@ class PhotoSubmission(Base):
     """Photo submission for air quality analysis"""
     __tablename__ = "photo_submissions"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=True, index=True)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("user_profiles.id"), nullable=True, index=True)
     
     # Photo data
     filename = Column(String, nullable=False)
@@ -197,16 +215,16 @@ class PhotoSubmission(Base):
     processed_at = Column(DateTime, nullable=True)
     
     # Metadata
-    device_info = Column(JSON, nullable=True)
-    weather_conditions = Column(JSON, nullable=True)
-    quality_indicators = Column(JSON, nullable=True)
+    device_info = Column(JSONDocument, nullable=True)
+    weather_conditions = Column(JSONDocument, nullable=True)
+    quality_indicators = Column(JSONDocument, nullable=True)
 
 class SensorDevice(Base):
     """Bluetooth sensor device model"""
     __tablename__ = "sensor_devices"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=True, index=True)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("user_profiles.id"), nullable=True, index=True)
     
     # Device information
     device_name = Column(String, nullable=False)
@@ -232,7 +250,7 @@ class SensorDevice(Base):
     # Settings
     auto_connect = Column(Boolean, default=True)
     update_interval = Column(Integer, default=60)  # seconds
-    alert_thresholds = Column(JSON, default={})
+    alert_thresholds = Column(JSONDocument, default={})
     
     # Timestamps
     created_at = Column(DateTime, server_default=func.now())
@@ -244,7 +262,7 @@ class HotspotAlert(Base):
     """Pollution hotspot alerts"""
     __tablename__ = "hotspot_alerts"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=generate_uuid)
     
     # Location and severity
     latitude = Column(Float, nullable=False)
@@ -255,11 +273,11 @@ class HotspotAlert(Base):
     # Alert details
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
-    recommended_actions = Column(JSON, nullable=True)
+    recommended_actions = Column(JSONDocument, nullable=True)
     
     # Coverage
     radius = Column(Float, default=1000)  # meters
-    affected_area = Column(JSON, nullable=True)
+    affected_area = Column(JSONDocument, nullable=True)
     estimated_population = Column(Integer, nullable=True)
     
     # Timing
@@ -275,8 +293,33 @@ class HotspotAlert(Base):
 
 # Indexes for performance
 Index('idx_air_quality_location_time', AirQualityReading.latitude, AirQualityReading.longitude, AirQualityReading.reading_time)
+Index(
+    'idx_air_quality_time_location',
+    AirQualityReading.reading_time.desc(),
+    AirQualityReading.latitude,
+    AirQualityReading.longitude,
+    postgresql_include=[
+        'aqi', 'aqi_category', 'pm25', 'pm10', 'no2', 'so2', 'co', 'o3', 'source', 'sensor_id'
+    ]
+)
+Index('idx_aqr_time_brin', AirQualityReading.reading_time, postgresql_using='brin')
 Index('idx_air_quality_aqi', AirQualityReading.aqi)
 Index('idx_air_quality_source', AirQualityReading.source)
+Index(
+    'idx_air_quality_earth',
+    func.ll_to_earth(AirQualityReading.latitude, AirQualityReading.longitude),
+    postgresql_using='gist'
+).ddl_if(dialect='postgresql')  # requires the cube and earthdistance extensions
+Index(
+    'idx_user_notif_prefs',
+    UserProfile.notification_preferences,
+    postgresql_using='gin'
+).ddl_if(dialect='postgresql')
+Index(
+    'idx_user_email_login',
+    UserProfile.email,
+    postgresql_include=['is_active', 'subscription_tier', 'subscription_tier_level']
+)
 Index('idx_prediction_location_time', PredictionData.latitude, PredictionData.longitude, PredictionData.prediction_time)
 Index('idx_photo_submissions_location', PhotoSubmission.latitude, PhotoSubmission.longitude)
 Index('idx_photo_submissions_user_time', PhotoSubmission.user_id, PhotoSubmission.submitted_at)
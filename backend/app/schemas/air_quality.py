@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
 from enum import Enum
 
 
@@ -13,6 +14,10 @@ class AQICategory(str, Enum):
     HAZARDOUS = "hazardous"
 
 
+# How far ahead of the server clock a reading may be stamped; later ones come from bad sensor clocks
+MAX_READING_CLOCK_SKEW = timedelta(minutes=10)
+
+
 class SubscriptionTier(str, Enum):
     FREE = "free"
     PRO = "pro"
@@ -29,7 +34,7 @@ class AirQualityBase(BaseModel):
     co: Optional[float] = Field(None, ge=0, le=50, description="CO concentration (mg/m³)")
     o3: Optional[float] = Field(None, ge=0, le=300, description="O3 concentration (µg/m³)")
     source: Optional[str] = Field("mobile", description="Source of the reading")
-    sensor_id: Optional[str] = Field(None, description="Sensor device ID")
+    sensor_id: Optional[UUID] = Field(None, description="Sensor device ID")
     temperature: Optional[float] = Field(None, ge=-50, le=60, description="Temperature (°C)")
     humidity: Optional[float] = Field(None, ge=0, le=100, description="Humidity (%)")
     pressure: Optional[float] = Field(None, ge=800, le=1200, description="Atmospheric pressure (hPa)")
@@ -38,7 +43,7 @@ class AirQualityBase(BaseModel):
 
 
 class AirQualityReading(AirQualityBase):
-    id: str
+    id: UUID
     aqi: Optional[int] = Field(None, ge=0, le=500)
     aqi_category: Optional[AQICategory]
     lung_safety_score: Optional[float] = Field(None, ge=0, le=100)
@@ -52,12 +57,19 @@ class AirQualityReading(AirQualityBase):
     confidence_score: float = 1.0
     calibration_factor: float = 1.0
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True, use_enum_values=True)
 
 
 class AirQualityReadingCreate(AirQualityBase):
     reading_time: datetime
+    
+    @field_validator("reading_time")
+    @classmethod
+    def reading_time_not_in_future(cls, value: datetime) -> datetime:
+        now = datetime.now(timezone.utc) if value.tzinfo else datetime.utcnow()
+        if value > now + MAX_READING_CLOCK_SKEW:
+            raise ValueError("reading_time is in the future")
+        return value
 
 
 class AirQualityReadingUpdate(BaseModel):
@@ -68,7 +80,17 @@ class AirQualityReadingUpdate(BaseModel):
     calibration_factor: Optional[float] = Field(None, ge=0.1, le=10)
 
 
+class AirQualityReadingBatchCreate(BaseModel):
+    readings: List[AirQualityReadingCreate] = Field(..., min_length=1, max_length=5000)
+
+
+class AirQualityReadingBatchResponse(BaseModel):
+    inserted: int
+
+
 class AQISummary(BaseModel):
+    model_config = ConfigDict(frozen=True, use_enum_values=True)
+
     current_aqi: Optional[int]
     category: Optional[AQICategory]
     health_recommendation: str
@@ -79,6 +101,8 @@ class AQISummary(BaseModel):
 
 
 class LocationStats(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     location_name: str
     latitude: float
     longitude: float
@@ -102,10 +126,23 @@ class HistoricalDataRequest(BaseModel):
     aggregation: Optional[str] = Field("hourly", pattern="^(hourly|daily|weekly)$")
 
 
-class HistoricalDataResponse(BaseModel):
+class HistoricalDataPoint(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    timestamp: datetime  # start of the aggregation bucket
+    count: int
+    aqi_avg: Optional[float]
+    aqi_min: Optional[int]
+    aqi_max: Optional[int]
+    aqi_median: Optional[float]
+    pm25_avg: Optional[float]
+    pm10_avg: Optional[float]
+
+
+class HistoricalDataHeader(BaseModel):
+    """First line of the historical NDJSON stream; HistoricalDataPoint lines follow"""
     location: Dict[str, float]
     period: Dict[str, datetime]
-    data_points: List[AirQualityReading]
     statistics: Dict[str, Any]
 
 
@@ -118,6 +155,8 @@ class PredictionRequest(BaseModel):
 
 
 class PredictionData(BaseModel):
+    model_config = ConfigDict(frozen=True, use_enum_values=True, protected_namespaces=())
+
     prediction_time: datetime
     predicted_pm25: Optional[float]
     predicted_pm10: Optional[float]
@@ -128,6 +167,8 @@ class PredictionData(BaseModel):
 
 
 class PredictionResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
     location: Dict[str, float]
     prediction_horizon: int
     predictions: List[PredictionData]
@@ -156,6 +197,8 @@ class AQICalculationRequest(BaseModel):
 
 
 class AQICalculationResponse(BaseModel):
+    model_config = ConfigDict(use_enum_values=True)
+
     aqi: int
     category: AQICategory
     primary_pollutant: Optional[str]
@@ -164,7 +207,7 @@ class AQICalculationResponse(BaseModel):
 
 
 class SensorReading(BaseModel):
-    sensor_id: str
+    sensor_id: UUID
     pm25: Optional[float] = None
     pm10: Optional[float] = None
     battery_level: Optional[int] = Field(None, ge=0, le=100)
@@ -174,7 +217,7 @@ class SensorReading(BaseModel):
 
 
 class SensorReadingResponse(BaseModel):
-    sensor_id: str
+    sensor_id: UUID
     latest_reading: Optional[AirQualityReading]
     connection_status: str
     last_seen: Optional[datetime]
@@ -200,16 +243,16 @@ class NearbySensorsResponse(BaseModel):
 
 
 class CalibrationRequest(BaseModel):
-    reading_id: str
-    sensor_id: str
+    reading_id: UUID
+    sensor_id: UUID
     reference_pm25: float
     reference_pm10: Optional[float] = None
     conditions: Optional[Dict[str, Any]] = None
 
 
 class CalibrationResponse(BaseModel):
-    reading_id: str
-    sensor_id: str
+    reading_id: UUID
+    sensor_id: UUID
     previous_factor: float
     new_factor: float
     calibration_quality: float
@@ -225,7 +268,7 @@ class HealthRecommendations(BaseModel):
 
 
 class RealTimeAlert(BaseModel):
-    alert_id: str
+    alert_id: UUID
     location: Dict[str, float]
     alert_level: str
     aqi_threshold: int
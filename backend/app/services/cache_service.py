@@ -1,45 +1,171 @@
 import redis.asyncio as redis
-import json
+import msgpack
+import orjson
 import logging
-from typing import Any, Optional, Dict
-from datetime import timedelta
+import struct
+import time
+import zlib
+from decimal import Decimal
+import fnmatch
+from typing import Any, AsyncIterator, Optional, Dict, List, Mapping, Tuple
+from datetime import date, datetime, timedelta, timezone
+
+from cachetools import TLRUCache
+from pydantic import BaseModel
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Keys per SCAN page and per pipelined DELETE/SET batch
+SCAN_BATCH_SIZE = 500
+
+# Bounds of the in-memory fallback used while Redis is unavailable
+MEMORY_CACHE_SIZE = 100000
+MEMORY_CACHE_TTL = 3600  # seconds, for keys set without a ttl
+
+# First byte of values written by set(); anything else is read as legacy JSON
+SERIALIZER_VERSION = b"\x01"
+SERIALIZER_ZSTD = b"\x02"  # msgpack compressed with zstd
+SERIALIZER_ZLIB = b"\x03"  # msgpack compressed with zlib, when zstandard isn't installed
+
+# msgpack extension types
+EXT_DATETIME = 1  # int64 nanoseconds since the epoch, UTC
+EXT_DECIMAL = 2  # decimal string
+
+_EPOCH = datetime(1970, 1, 1)
+_INT64 = struct.Struct(">q")
+
+if ZSTD_AVAILABLE:
+    _zstd_compressor = zstandard.ZstdCompressor(level=1)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+def _msgpack_default(value: Any) -> Any:
+    """Encode types msgpack doesn't handle natively"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        nanoseconds = (value - _EPOCH) // timedelta(microseconds=1) * 1000
+        return msgpack.ExtType(EXT_DATETIME, _INT64.pack(nanoseconds))
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode())
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if hasattr(value, "tolist"):  # numpy arrays and scalars
+        return value.tolist()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    """Decode the extension types written by _msgpack_default"""
+    if code == EXT_DATETIME:
+        return _EPOCH + timedelta(microseconds=_INT64.unpack(data)[0] // 1000)
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+def pack_value(value: Any) -> bytes:
+    """Unversioned msgpack encoding for set_packed payloads; datetimes become int64 epoch nanoseconds"""
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+def unpack_value(raw: bytes) -> Any:
+    """Decode a payload written by pack_value"""
+    return msgpack.unpackb(raw, raw=False, ext_hook=_msgpack_ext_hook)
+
+def serialize_value(value: Any) -> bytes:
+    """Versioned msgpack encoding for cache values; large values are compressed at a fast level"""
+    packed = pack_value(value)
+    if len(packed) <= settings.CACHE_COMPRESS_THRESHOLD:
+        return SERIALIZER_VERSION + packed
+    if ZSTD_AVAILABLE:
+        return SERIALIZER_ZSTD + _zstd_compressor.compress(packed)
+    return SERIALIZER_ZLIB + zlib.compress(packed, 1)
+
+def deserialize_value(raw: bytes) -> Any:
+    """Decode a value written by serialize_value, or a JSON value written before it"""
+    header = raw[:1]
+    if header == SERIALIZER_ZSTD:
+        return msgpack.unpackb(_zstd_decompressor.decompress(raw[1:]), raw=False, ext_hook=_msgpack_ext_hook)
+    if header == SERIALIZER_ZLIB:
+        return msgpack.unpackb(zlib.decompress(raw[1:]), raw=False, ext_hook=_msgpack_ext_hook)
+    if header == SERIALIZER_VERSION:
+        try:
+            return msgpack.unpackb(raw[1:], raw=False, ext_hook=_msgpack_ext_hook)
+        except Exception:
+            pass
+    return orjson.loads(raw)
+
+class MemoryCache(TLRUCache):
+    """LRU-bounded fallback cache whose entries expire after a per-key ttl"""
+    
+    def __init__(self, maxsize: int, default_ttl: int):
+        super().__init__(maxsize=maxsize, ttu=self._ttu, timer=time.monotonic)
+        self.default_ttl = default_ttl
+        self._ttl: Optional[int] = None
+    
+    def _ttu(self, key: str, value: Any, now: float) -> float:
+        return now + (self._ttl or self.default_ttl)
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Store ``value`` expiring ``ttl`` seconds from now (the default ttl when None)"""
+        self._ttl = ttl
+        try:
+            self[key] = value
+        finally:
+            self._ttl = None
+    
+    def set_ttl(self, key: str, ttl: int) -> bool:
+        """Restart ``key``'s expiry at ``ttl`` seconds; False if it isn't cached"""
+        if key not in self:
+            return False
+        self.set(key, self[key], ttl)
+        return True
+
 class CacheService:
     """Redis-based cache service"""
     
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
+        # Separate client without response decoding for msgpack payloads
+        self.binary_client: Optional[redis.Redis] = None
+        # Only touched from the event loop and never across an await, so it needs no lock
+        self._memory_cache = MemoryCache(MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL)
     
     async def initialize(self):
         """Initialize Redis connection"""
         try:
             self.redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
             await self.redis_client.ping()
+            self.binary_client = redis.from_url(settings.REDIS_URL)
             logger.info("Cache service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize cache service: {e}")
             # Fallback to in-memory cache
             self.redis_client = None
-            self._memory_cache = {}
+            self.binary_client = None
     
     async def shutdown(self):
         """Shutdown Redis connection"""
         if self.redis_client:
             await self.redis_client.close()
+            await self.binary_client.close()
             logger.info("Cache service shutdown complete")
     
     async def get(self, key: str, default: Any = None) -> Any:
         """Get value from cache"""
         try:
-            if self.redis_client:
-                value = await self.redis_client.get(key)
+            if self.binary_client:
+                value = await self.binary_client.get(key)
                 if value is None:
                     return default
-                return json.loads(value)
+                return deserialize_value(value)
             else:
                 # Fallback to memory cache
                 return self._memory_cache.get(key, default)
@@ -50,22 +176,60 @@ class CacheService:
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache"""
         try:
-            serialized_value = json.dumps(value, default=str)
+            serialized_value = serialize_value(value)
             
-            if self.redis_client:
-                if ttl:
-                    await self.redis_client.setex(key, ttl, serialized_value)
-                else:
-                    await self.redis_client.set(key, serialized_value)
+            if self.binary_client:
+                await self.binary_client.set(key, serialized_value, ex=ttl)
                 return True
             else:
                 # Fallback to memory cache
-                self._memory_cache[key] = value
+                self._memory_cache.set(key, value, ttl)
                 return True
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
             return False
     
+    async def get_packed(self, key: str, default: Any = None) -> Any:
+        """Get a msgpack-encoded value from cache"""
+        try:
+            if self.binary_client:
+                value = await self.binary_client.get(key)
+            else:
+                # Fallback to memory cache
+                value = self._memory_cache.get(key)
+            if value is None:
+                return default
+            return unpack_value(value)
+        except Exception as e:
+            logger.error(f"Cache get error for key {key}: {e}")
+            return default
+    
+    async def get_many_packed(self, keys: List[str]) -> List[Any]:
+        """Get several msgpack-encoded values in one round trip; missing keys come back as None"""
+        try:
+            if self.binary_client:
+                values = await self.binary_client.mget(keys)
+            else:
+                # Fallback to memory cache
+                values = [self._memory_cache.get(key) for key in keys]
+            return [None if value is None else unpack_value(value) for value in values]
+        except Exception as e:
+            logger.error(f"Cache mget error for {len(keys)} keys: {e}")
+            return [None] * len(keys)
+    
+    async def set_packed(self, key: str, payload: bytes, ttl: Optional[int] = None) -> bool:
+        """Set an already msgpack-encoded value in cache"""
+        try:
+            if self.binary_client:
+                await self.binary_client.set(key, payload, ex=ttl)
+            else:
+                # Fallback to memory cache
+                self._memory_cache.set(key, payload, ttl)
+            return True
+        except Exception as e:
+            logger.error(f"Cache set error for key {key}: {e}")
+            return False
+    
     async def delete(self, key: str) -> bool:
         """Delete key from cache"""
         try:
@@ -94,18 +258,23 @@ class CacheService:
             logger.error(f"Cache exists error for key {key}: {e}")
             return False
     
-    async def increment(self, key: str, amount: int = 1) -> Optional[int]:
-        """Increment numeric value in cache"""
+    async def increment(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> Optional[int]:
+        """Increment numeric value in cache, optionally (re)setting its expiry in the same round trip"""
         try:
             if self.redis_client:
-                result = await self.redis_client.incrby(key, amount)
+                if ttl:
+                    async with self.redis_client.pipeline(transaction=False) as pipe:
+                        pipe.incrby(key, amount)
+                        pipe.expire(key, ttl)
+                        result, _ = await pipe.execute()
+                else:
+                    result = await self.redis_client.incrby(key, amount)
                 return result
             else:
                 # Fallback to memory cache
-                if key not in self._memory_cache:
-                    self._memory_cache[key] = 0
-                self._memory_cache[key] += amount
-                return self._memory_cache[key]
+                result = self._memory_cache.get(key, 0) + amount
+                self._memory_cache.set(key, result, ttl)
+                return result
         except Exception as e:
             logger.error(f"Cache increment error for key {key}: {e}")
             return None
@@ -117,8 +286,8 @@ class CacheService:
                 result = await self.redis_client.expire(key, seconds)
                 return result
             else:
-                # Memory cache doesn't support expiration
-                return True
+                # Fallback to memory cache
+                return self._memory_cache.set_ttl(key, seconds)
         except Exception as e:
             logger.error(f"Cache expire error for key {key}: {e}")
             return False
@@ -137,16 +306,20 @@ class CacheService:
             logger.error(f"Cache flush error: {e}")
             return False
     
+    async def scan_pattern(self, pattern: str) -> AsyncIterator[str]:
+        """Yield keys matching pattern using non-blocking SCAN"""
+        if self.redis_client:
+            async for key in self.redis_client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE):
+                yield key
+        else:
+            # Memory cache - simple pattern matching
+            for key in [key for key in self._memory_cache if fnmatch.fnmatch(key, pattern)]:
+                yield key
+    
     async def get_pattern(self, pattern: str) -> list:
         """Get all keys matching pattern"""
         try:
-            if self.redis_client:
-                keys = await self.redis_client.keys(pattern)
-                return keys
-            else:
-                # Memory cache - simple pattern matching
-                import fnmatch
-                return [key for key in self._memory_cache.keys() if fnmatch.fnmatch(key, pattern)]
+            return [key async for key in self.scan_pattern(pattern)]
         except Exception as e:
             logger.error(f"Cache pattern error for pattern {pattern}: {e}")
             return []
@@ -155,11 +328,16 @@ class CacheService:
         """Delete all keys matching pattern"""
         try:
             if self.redis_client:
-                keys = await self.get_pattern(pattern)
-                if keys:
-                    result = await self.redis_client.delete(*keys)
-                    return result
-                return 0
+                deleted = 0
+                batch = []
+                async for key in self.scan_pattern(pattern):
+                    batch.append(key)
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        deleted += await self._delete_batch(batch)
+                        batch = []
+                if batch:
+                    deleted += await self._delete_batch(batch)
+                return deleted
             else:
                 # Memory cache
                 keys_to_delete = await self.get_pattern(pattern)
@@ -168,4 +346,80 @@ class CacheService:
                 return len(keys_to_delete)
         except Exception as e:
             logger.error(f"Cache pattern delete error for pattern {pattern}: {e}")
-            return 0
\ No newline at end of file
+            return 0
+    
+    async def _delete_batch(self, keys: List[str]) -> int:
+        """Delete a batch of keys in one pipelined round trip"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            (deleted,) = await pipe.execute()
+        return deleted
+    
+    async def mget(self, keys: List[str]) -> List[Any]:
+        """Get several values in one round trip; missing keys come back as None"""
+        if not keys:
+            return []
+        try:
+            if self.binary_client:
+                values = await self.binary_client.mget(keys)
+                return [None if value is None else deserialize_value(value) for value in values]
+            else:
+                # Fallback to memory cache
+                return [self._memory_cache.get(key) for key in keys]
+        except Exception as e:
+            logger.error(f"Cache mget error for {len(keys)} keys: {e}")
+            return [None] * len(keys)
+    
+    async def mset(self, mapping: Mapping[str, Any], ttl: Optional[int] = None) -> bool:
+        """Set several values (with a shared expiry) in one pipelined round trip"""
+        if not mapping:
+            return True
+        try:
+            if self.binary_client:
+                async with self.binary_client.pipeline(transaction=False) as pipe:
+                    for key, value in mapping.items():
+                        pipe.set(key, serialize_value(value), ex=ttl)
+                    await pipe.execute()
+            else:
+                # Fallback to memory cache
+                for key, value in mapping.items():
+                    self._memory_cache.set(key, value, ttl)
+            return True
+        except Exception as e:
+            logger.error(f"Cache mset error for {len(mapping)} keys: {e}")
+            return False
+    
+    async def geo_add(self, key: str, positions: Mapping[str, Tuple[float, float]]) -> bool:
+        """Add or move members of a geo index; ``positions`` maps member -> (latitude, longitude)"""
+        if not positions:
+            return True
+        try:
+            if self.redis_client:
+                values = []
+                for member, (latitude, longitude) in positions.items():
+                    values.extend((longitude, latitude, member))
+                await self.redis_client.geoadd(key, values)
+                return True
+            # No in-memory geo index; callers fall back to scanning
+            return False
+        except Exception as e:
+            logger.error(f"Cache geo_add error for key {key}: {e}")
+            return False
+    
+    async def geo_search(self, key: str, latitude: float, longitude: float,
+                         radius: float) -> Optional[List[str]]:
+        """
+        Members of a geo index within ``radius`` meters of a point, nearest first.
+        Returns None when the index is unavailable or hasn't been built, so callers can scan instead.
+        """
+        try:
+            if self.redis_client:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.exists(key)
+                    pipe.geosearch(key, longitude=longitude, latitude=latitude, radius=radius, unit="m", sort="ASC")
+                    exists, members = await pipe.execute()
+                return members if exists else None
+            return None
+        except Exception as e:
+            logger.error(f"Cache geo_search error for key {key}: {e}")
+            return None
@@ -1,24 +1,85 @@
 import aiohttp
 import asyncio
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+import orjson
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+from datetime import datetime
+from cachetools import TTLCache
 
 from app.core.config import settings
+from app.core.geo import geo_cell
 
 logger = logging.getLogger(__name__)
 
+
+# Grid resolution of cached results: 1/1000 degree (~100 m) for air quality, 1/10000 (~10 m) otherwise
+AIR_QUALITY_CELL_SCALE = 1000
+LOCATION_CELL_SCALE = 10000
+
+OPENWEATHER_AQI_URL = "http://api.openweathermap.org/data/2.5/air_pollution"
+OPENWEATHER_WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+GOOGLE_GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Google address component type -> location field it fills
+GEOCODING_COMPONENT_FIELDS = {
+    "locality": "city",
+    "administrative_area_level_2": "city",
+    "country": "country",
+    "administrative_area_level_1": "state"
+}
+
+# (our field, OpenWeatherMap component, scale); OpenWeatherMap reports CO in µg/m³, we store mg/m³
+OPENWEATHER_COMPONENTS = (
+    ("pm25", "pm2_5", 1.0),
+    ("pm10", "pm10", 1.0),
+    ("no2", "no2", 1.0),
+    ("so2", "so2", 1.0),
+    ("co", "co", 0.001),
+    ("o3", "o3", 1.0)
+)
+
+
+def air_quality_cache_key(cell: int) -> str:
+    """Shared cache key for an external air quality grid cell"""
+    return f"external_aq:{cell:x}"
+
+
 class ExternalAPIService:
     """Service for external API integrations (weather, air quality APIs, etc.)"""
     
-    def __init__(self):
+    def __init__(self, cache_service=None):
         self.session: Optional[aiohttp.ClientSession] = None
-        self.cache = {}
+        # Weather and geocoding results keyed by ~10 m cell; TTLCache evicts expired and
+        # least recently used entries so memory stays bounded under sustained traffic
+        self.weather_cache = TTLCache(maxsize=10000, ttl=3600)
+        self.geocoding_cache = TTLCache(maxsize=10000, ttl=86400)
+        # Optional CacheService shared across workers; bulk lookups read and write it in batches
+        self.shared_cache = cache_service
+        # Air quality results keyed by ~100 m grid cell
+        self.air_quality_cache = TTLCache(maxsize=10000, ttl=settings.EXTERNAL_CACHE_TTL)
+        # Upstream fetches currently in flight, keyed by (kind, cell)
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        # Bounds concurrent air quality provider calls to respect upstream rate limits
+        self._request_limit = asyncio.Semaphore(settings.EXTERNAL_API_CONCURRENCY)
+        # Provider keys and the constant part of each request's query, bound once
+        self._owm_key = settings.OPENWEATHER_API_KEY
+        self._gmaps_key = settings.GOOGLE_MAPS_API_KEY
+        self._owm_aqi_params = {"appid": self._owm_key}
+        self._owm_weather_params = {"appid": self._owm_key, "units": "metric"}
+        self._gmaps_params = {"key": self._gmaps_key}
     
     async def initialize(self):
         """Initialize the service"""
         timeout = aiohttp.ClientTimeout(total=30)
-        self.session = aiohttp.ClientSession(timeout=timeout)
+        # Keep provider connections (and their TLS sessions) alive between calls and cache
+        # DNS lookups, so bursts reuse warm connections instead of re-handshaking
+        connector = aiohttp.TCPConnector(
+            limit=settings.EXTERNAL_HTTP_CONNECTIONS,
+            limit_per_host=settings.EXTERNAL_HTTP_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=60
+        )
+        self.session = aiohttp.ClientSession(timeout=timeout, connector=connector)
         logger.info("External API service initialized")
     
     async def shutdown(self):
@@ -27,22 +88,67 @@ class ExternalAPIService:
             await self.session.close()
             logger.info("External API service shutdown complete")
     
+    async def _single_flight(self, key: Tuple[str, int],
+                             fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """Run ``fetch`` once per key; concurrent callers for the same key await the same task"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        
+        # Shield so a cancelled caller doesn't cancel the fetch other callers are waiting on
+        return await asyncio.shield(task)
+    
     async def get_air_quality_data(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-        """Get air quality data from external APIs"""
-        cache_key = f"aqi_{latitude:.4f}_{longitude:.4f}"
+        """Get air quality data from external APIs; concurrent calls for the same grid cell share one fetch"""
+        cache_key = geo_cell(latitude, longitude, AIR_QUALITY_CELL_SCALE)
         
         # Check cache first
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.utcnow() - timestamp < timedelta(minutes=30):
-                return cached_data
+        if cache_key in self.air_quality_cache:
+            return self.air_quality_cache[cache_key]
+        
+        return await self._single_flight(
+            ("air_quality", cache_key),
+            lambda: self._fetch_air_quality_data(cache_key, latitude, longitude)
+        )
+    
+    async def get_air_quality_data_many(self, locations: List[Tuple[float, float]]) -> List[Optional[Dict[str, Any]]]:
+        """Air quality data for several (lat, lon) pairs, checking the shared cache with one MGET"""
+        cells = [geo_cell(lat, lon, AIR_QUALITY_CELL_SCALE) for lat, lon in locations]
+        results: Dict[int, Optional[Dict[str, Any]]] = {
+            cell: self.air_quality_cache[cell] for cell in set(cells) if cell in self.air_quality_cache
+        }
+        
+        pending = {cell: location for cell, location in zip(cells, locations) if cell not in results}
+        if pending and self.shared_cache:
+            shared = await self.shared_cache.mget([air_quality_cache_key(cell) for cell in pending])
+            for cell, data in zip(list(pending), shared):
+                if data:
+                    self.air_quality_cache[cell] = results[cell] = data
+                    del pending[cell]
         
+        if pending:
+            fetched = await asyncio.gather(*[self.get_air_quality_data(*location) for location in pending.values()])
+            results.update(zip(pending, fetched))
+            if self.shared_cache:
+                await self.shared_cache.mset(
+                    {air_quality_cache_key(cell): data for cell, data in zip(pending, fetched) if data},
+                    ttl=settings.EXTERNAL_CACHE_TTL
+                )
+        
+        return [results.get(cell) for cell in cells]
+    
+    async def _fetch_air_quality_data(self, cache_key: int, latitude: float,
+                                      longitude: float) -> Optional[Dict[str, Any]]:
+        """Fetch air quality data from the first provider that answers and cache it"""
         try:
             # Try OpenWeatherMap API first
-            if settings.OPENWEATHER_API_KEY:
-                owm_data = await self._get_openweather_aqi(latitude, longitude)
+            if self._owm_key:
+                async with self._request_limit:
+                    owm_data = await self._get_openweather_aqi(latitude, longitude)
                 if owm_data:
-                    self.cache[cache_key] = (owm_data, datetime.utcnow())
+                    self.air_quality_cache[cache_key] = owm_data
                     return owm_data
             
             # Fallback to other APIs
@@ -57,32 +163,24 @@ class ExternalAPIService:
     async def _get_openweather_aqi(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
         """Get air quality data from OpenWeatherMap"""
         try:
-            url = f"http://api.openweathermap.org/data/2.5/air_pollution"
-            params = {
-                "lat": latitude,
-                "lon": longitude,
-                "appid": settings.OPENWEATHER_API_KEY
-            }
+            params = {**self._owm_aqi_params, "lat": latitude, "lon": longitude}
             
-            async with self.session.get(url, params=params) as response:
+            async with self.session.get(OPENWEATHER_AQI_URL, params=params) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = orjson.loads(await response.read())
                     
                     if "list" in data and len(data["list"]) > 0:
                         air_data = data["list"][0]
                         components = air_data.get("components", {})
                         
-                        # Convert OpenWeatherMap format to our format
-                        return {
-                            "pm25": components.get("pm2_5"),
-                            "pm10": components.get("pm10"),
-                            "no2": components.get("no2"),
-                            "so2": components.get("so2"),
-                            "co": components.get("co") / 1000,  # Convert µg/m³ to mg/m³
-                            "o3": components.get("o3"),
-                            "reading_time": datetime.utcfromtimestamp(air_data["dt"]),
-                            "source": "openweathermap"
+                        # Convert OpenWeatherMap format to our format; absent components stay None
+                        values = {
+                            field: None if components.get(component) is None else components[component] * scale
+                            for field, component, scale in OPENWEATHER_COMPONENTS
                         }
+                        values["reading_time"] = datetime.utcfromtimestamp(air_data["dt"])
+                        values["source"] = "openweathermap"
+                        return values
                 
                 logger.warning(f"OpenWeatherMap API returned status {response.status}")
                 return None
@@ -92,20 +190,27 @@ class ExternalAPIService:
             return None
     
     async def get_weather_data(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-        """Get weather data from external APIs"""
-        cache_key = f"weather_{latitude:.4f}_{longitude:.4f}"
+        """Get weather data from external APIs; concurrent calls for the same cell share one fetch"""
+        cache_key = geo_cell(latitude, longitude, LOCATION_CELL_SCALE)
         
         # Check cache first
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.utcnow() - timestamp < timedelta(hours=1):
-                return cached_data
+        cached_data = self.weather_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
+        return await self._single_flight(
+            ("weather", cache_key),
+            lambda: self._fetch_weather_data(cache_key, latitude, longitude)
+        )
+    
+    async def _fetch_weather_data(self, cache_key: int, latitude: float,
+                                  longitude: float) -> Optional[Dict[str, Any]]:
+        """Fetch weather data and cache it"""
         try:
-            if settings.OPENWEATHER_API_KEY:
+            if self._owm_key:
                 weather_data = await self._get_openweather_weather(latitude, longitude)
                 if weather_data:
-                    self.cache[cache_key] = (weather_data, datetime.utcnow())
+                    self.weather_cache[cache_key] = weather_data
                     return weather_data
             
             return None
@@ -117,17 +222,11 @@ class ExternalAPIService:
     async def _get_openweather_weather(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
         """Get weather data from OpenWeatherMap"""
         try:
-            url = f"http://api.openweathermap.org/data/2.5/weather"
-            params = {
-                "lat": latitude,
-                "lon": longitude,
-                "appid": settings.OPENWEATHER_API_KEY,
-                "units": "metric"
-            }
+            params = {**self._owm_weather_params, "lat": latitude, "lon": longitude}
             
-            async with self.session.get(url, params=params) as response:
+            async with self.session.get(OPENWEATHER_WEATHER_URL, params=params) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = orjson.loads(await response.read())
                     
                     return {
                         "temperature": data["main"]["temp"],
@@ -158,20 +257,27 @@ class ExternalAPIService:
         return None
     
     async def get_geocoding_data(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-        """Get location name from coordinates"""
-        cache_key = f"geo_{latitude:.4f}_{longitude:.4f}"
+        """Get location name from coordinates; concurrent calls for the same cell share one lookup"""
+        cache_key = geo_cell(latitude, longitude, LOCATION_CELL_SCALE)
         
         # Check cache first
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.utcnow() - timestamp < timedelta(days=1):
-                return cached_data
+        cached_data = self.geocoding_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
+        return await self._single_flight(
+            ("geocoding", cache_key),
+            lambda: self._fetch_geocoding_data(cache_key, latitude, longitude)
+        )
+    
+    async def _fetch_geocoding_data(self, cache_key: int, latitude: float,
+                                    longitude: float) -> Optional[Dict[str, Any]]:
+        """Look up location data and cache it"""
         try:
-            if settings.GOOGLE_MAPS_API_KEY:
+            if self._gmaps_key:
                 geo_data = await self._get_google_geocoding(latitude, longitude)
                 if geo_data:
-                    self.cache[cache_key] = (geo_data, datetime.utcnow())
+                    self.geocoding_cache[cache_key] = geo_data
                     return geo_data
             
             return None
@@ -183,15 +289,11 @@ class ExternalAPIService:
     async def _get_google_geocoding(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
         """Get location data from Google Geocoding API"""
         try:
-            url = f"https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                "latlng": f"{latitude},{longitude}",
-                "key": settings.GOOGLE_MAPS_API_KEY
-            }
+            params = {**self._gmaps_params, "latlng": f"{latitude},{longitude}"}
             
-            async with self.session.get(url, params=params) as response:
+            async with self.session.get(GOOGLE_GEOCODING_URL, params=params) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = orjson.loads(await response.read())
                     
                     if "results" in data and len(data["results"]) > 0:
                         result = data["results"][0]
@@ -205,15 +307,20 @@ class ExternalAPIService:
                             "types": result.get("types", [])
                         }
                         
-                        # Extract city and country
+                        # Extract city, state and country; components run from most to least
+                        # specific, so the first match per field wins and we stop once all are found
+                        needed = {"city", "country", "state"}
                         for component in address_components:
-                            types = component.get("types", [])
-                            if "locality" in types or "administrative_area_level_2" in types:
-                                location_data["city"] = component.get("long_name")
-                            elif "country" in types:
-                                location_data["country"] = component.get("long_name")
-                            elif "administrative_area_level_1" in types:
-                                location_data["state"] = component.get("long_name")
+                            field = next(
+                                (GEOCODING_COMPONENT_FIELDS[t] for t in component.get("types", ())
+                                 if t in GEOCODING_COMPONENT_FIELDS),
+                                None
+                            )
+                            if field in needed:
+                                location_data[field] = component.get("long_name")
+                                needed.discard(field)
+                                if not needed:
+                                    break
                         
                         return location_data
                 
@@ -1,14 +1,67 @@
+import asyncio
+import os
 import tensorflow as tf
 import numpy as np
+import cv2
+import anyio
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime
-import pickle
+import joblib
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+
+def _rule_based_kernel(temp: float, humidity: float, wind_speed: float, hour: float) -> int:
+    """Rule-based AQI estimate for one location"""
+    aqi = 50
+    
+    # Temperature effect
+    if temp > 30:
+        aqi += 20
+    elif temp < 0:
+        aqi += 10
+    
+    # Humidity effect
+    if humidity > 80:
+        aqi += 15
+    elif humidity < 30:
+        aqi += 10
+    
+    # Wind speed effect
+    if wind_speed < 1:
+        aqi += 20
+    elif wind_speed > 10:
+        aqi -= 15
+    
+    # Time of day effect
+    if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
+        aqi += 25
+    elif 22 <= hour or hour <= 6:  # Night time
+        aqi -= 10
+    
+    # Ensure AQI is within bounds
+    return max(0, min(500, aqi))
+
+
+if NUMBA_AVAILABLE:
+    _rule_based_kernel = njit(cache=True, fastmath=True)(_rule_based_kernel)
+
+
 class MLService:
     """Machine Learning service for air quality predictions and image analysis"""
     
@@ -16,67 +69,133 @@ class MLService:
         self.image_model: Optional[tf.lite.Interpreter] = None
         self.prediction_model: Optional[Any] = None
         self.models_loaded = False
+        # Set once initialize has finished, whether or not the models loaded
+        self.ready = asyncio.Event()
+        # Image model tensor indices, input (width, height) and a reused input buffer,
+        # read from the model once it's loaded
+        self._image_input_index: Optional[int] = None
+        self._image_output_index: Optional[int] = None
+        self._image_size: Optional[Tuple[int, int]] = None
+        self._image_channels_first = False
+        # (scale, zero_point) of an integer-quantized output, None for float models
+        self._image_output_quantization: Optional[Tuple[float, int]] = None
+        # True when the model outputs one value per image rather than a row of scores
+        self._image_output_1d = False
+        self._preproc_buf: Optional[np.ndarray] = None
+        # Concurrent image requests are queued and run through the model in batches;
+        # _image_batch_size is the batch dimension the interpreter is currently sized for
+        self._image_queue: Optional[asyncio.Queue] = None
+        self._image_worker: Optional[asyncio.Task] = None
+        self._image_batch_size = 1
+        # Prediction model input row, refilled on every call
+        self._feat_buf = np.empty((1, 6), dtype=np.float64)
+        # Input name when the prediction model is an ONNX Runtime session
+        self._onnx_input_name: Optional[str] = None
     
     async def initialize(self):
         """Initialize ML models"""
         try:
-            await self._load_models()
+            # Model loading and kernel compilation block, so they run off the event loop
+            await anyio.to_thread.run_sync(self._load_models)
+            if self.image_model:
+                self._image_queue = asyncio.Queue()
+                self._image_worker = asyncio.create_task(self._run_image_batches())
             self.models_loaded = True
             logger.info("ML service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize ML service: {e}")
             self.models_loaded = False
+        finally:
+            self.ready.set()
     
     async def shutdown(self):
         """Shutdown ML service"""
+        if self._image_worker:
+            self._image_worker.cancel()
+            try:
+                await self._image_worker
+            except asyncio.CancelledError:
+                pass
         logger.info("ML service shutdown complete")
     
-    async def _load_models(self):
-        """Load TensorFlow Lite models"""
+    def _load_models(self):
+        """Load TensorFlow Lite models and compile the fallback kernel"""
         try:
             # Load image-to-PM2.5 model
             if tf.io.gfile.exists(settings.IMAGE_MODEL_PATH):
-                self.image_model = tf.lite.Interpreter(model_path=settings.IMAGE_MODEL_PATH)
+                # BUILTIN applies the XNNPACK delegate (SIMD CPU kernels) to supported ops;
+                # asked for explicitly so a default change can't drop us to reference kernels.
+                # The thread count has to be set here, before allocate_tensors; by default half
+                # the CPUs (roughly the physical cores) so the event loop and DB driver keep some
+                self.image_model = tf.lite.Interpreter(
+                    model_path=settings.IMAGE_MODEL_PATH,
+                    num_threads=settings.IMAGE_MODEL_THREADS or max(2, (os.cpu_count() or 2) // 2),
+                    experimental_op_resolver_type=tf.lite.experimental.OpResolverType.BUILTIN
+                )
                 self.image_model.allocate_tensors()
+                
+                # Models are NHWC unless converted channels-first; follow whichever the input declares
+                input_details = self.image_model.get_input_details()[0]
+                input_shape = tuple(int(dim) for dim in input_details['shape'][1:])
+                self._image_channels_first = input_shape[0] == 3 and input_shape[2] != 3
+                height, width = input_shape[1:] if self._image_channels_first else input_shape[:2]
+                self._image_input_index = input_details['index']
+                output_details = self.image_model.get_output_details()[0]
+                self._image_output_index = output_details['index']
+                self._image_output_1d = len(output_details['shape']) == 1
+                self._image_size = (width, height)
+                # INT8-quantized models take raw uint8 pixels and return quantized outputs
+                self._preproc_buf = np.empty((settings.IMAGE_BATCH_SIZE, *input_shape), dtype=input_details['dtype'])
+                scale, zero_point = output_details['quantization']
+                if scale:
+                    self._image_output_quantization = (float(scale), int(zero_point))
                 logger.info("Image-to-PM2.5 model loaded successfully")
             else:
                 logger.warning(f"Image model not found at {settings.IMAGE_MODEL_PATH}")
             
-            # Load prediction model
-            if tf.io.gfile.exists(settings.PREDICTION_MODEL_PATH):
-                with open(settings.PREDICTION_MODEL_PATH, 'rb') as f:
-                    self.prediction_model = pickle.load(f)
+            # Load prediction model, preferring the ONNX export when onnxruntime is installed
+            if ONNXRUNTIME_AVAILABLE and os.path.exists(settings.PREDICTION_ONNX_MODEL_PATH):
+                # Inputs are a single 1x6 row; extra threads would only add synchronization
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = 1
+                options.inter_op_num_threads = 1
+                session = ort.InferenceSession(
+                    settings.PREDICTION_ONNX_MODEL_PATH, sess_options=options, providers=["CPUExecutionProvider"]
+                )
+                model_input = session.get_inputs()[0]
+                self._onnx_input_name = model_input.name
+                self._feat_buf = np.empty(
+                    (1, 6), dtype=np.float64 if model_input.type == "tensor(double)" else np.float32
+                )
+                # Published last: requests may already be running while the models load
+                self.prediction_model = session
+                logger.info("Prediction model loaded successfully (ONNX Runtime)")
+            elif tf.io.gfile.exists(settings.PREDICTION_MODEL_PATH):
+                # Large arrays in joblib dumps are memory-mapped, so workers share them via the page cache
+                self.prediction_model = joblib.load(settings.PREDICTION_MODEL_PATH, mmap_mode='r')
                 logger.info("Prediction model loaded successfully")
             else:
                 logger.warning(f"Prediction model not found at {settings.PREDICTION_MODEL_PATH}")
+            
+            # Compile (or load from the on-disk cache) the fallback kernel before the first request needs it
+            _rule_based_kernel(20.0, 50.0, 2.0, 12.0)
                 
         except Exception as e:
             logger.error(f"Error loading ML models: {e}")
     
     async def predict_pm25_from_image(self, image_data: bytes) -> Dict[str, Any]:
         """Predict PM2.5 concentration from image"""
-        if not self.image_model:
+        if self._image_queue is None:
             raise ValueError("Image model not loaded")
         
         try:
-            # Preprocess image
-            input_details = self.image_model.get_input_details()
-            output_details = self.image_model.get_output_details()
-            
-            # Convert image bytes to numpy array and preprocess
-            # This is a simplified version - actual implementation would depend on model requirements
-            processed_image = self._preprocess_image(image_data)
-            
-            # Make prediction
-            self.image_model.set_tensor(input_details[0]['index'], processed_image)
-            self.image_model.invoke()
-            
-            # Get prediction
-            prediction = self.image_model.get_tensor(output_details[0]['index'])
-            confidence = self._calculate_confidence(prediction)
+            # Queue the image for the next batch and wait for its prediction
+            future = asyncio.get_running_loop().create_future()
+            await self._image_queue.put((image_data, future))
+            predicted_pm25, confidence = await future
             
             return {
-                "predicted_pm25": float(prediction[0][0]) if len(prediction.shape) > 1 else float(prediction[0]),
+                "predicted_pm25": predicted_pm25,
                 "confidence_score": confidence,
                 "model_version": "1.0.0",
                 "prediction_time": datetime.utcnow()
@@ -90,6 +209,70 @@ class MLService:
                 "error": str(e)
             }
     
+    async def _run_image_batches(self):
+        """Collect queued images into batches of up to IMAGE_BATCH_SIZE and run each with one invoke"""
+        while True:
+            batch = [await self._image_queue.get()]
+            if self._image_queue.empty():
+                # Give concurrent requests a moment to join a lone image
+                await asyncio.sleep(settings.IMAGE_BATCH_WAIT_MS / 1000)
+            while len(batch) < settings.IMAGE_BATCH_SIZE and not self._image_queue.empty():
+                batch.append(self._image_queue.get_nowait())
+            
+            batch = [(image_data, future) for image_data, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            
+            # Inference runs in a worker thread; this loop is its only caller, so the
+            # interpreter and the input buffer are never used by two batches at once
+            try:
+                results = await anyio.to_thread.run_sync(
+                    self._predict_image_batch, [image_data for image_data, _ in batch]
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+    
+    def _predict_image_batch(self, images: List[bytes]) -> List[Union[Tuple[float, float], Exception]]:
+        """(PM2.5, confidence) per image, or the error preprocessing it raised"""
+        results: List[Union[Tuple[float, float], Exception, None]] = [None] * len(images)
+        rows = []
+        for i, image_data in enumerate(images):
+            try:
+                self._preprocess_image(image_data, self._preproc_buf[len(rows)])
+                rows.append(i)
+            except Exception as e:
+                results[i] = e
+        
+        if rows:
+            count = len(rows)
+            if count != self._image_batch_size:
+                self.image_model.resize_tensor_input(self._image_input_index, [count, *self._preproc_buf.shape[1:]])
+                self.image_model.allocate_tensors()
+                self._image_batch_size = count
+            
+            self.image_model.set_tensor(self._image_input_index, self._preproc_buf[:count])
+            self.image_model.invoke()
+            output = self.image_model.get_tensor(self._image_output_index)
+            if self._image_output_quantization:
+                scale, zero_point = self._image_output_quantization
+                output = (output.astype(np.float32) - zero_point) * scale
+            
+            # Converted to Python floats once for the whole batch
+            predicted_pm25 = (output if self._image_output_1d else output[:, 0]).tolist()
+            confidences = self._calculate_confidence(output).tolist()
+            for row, i in enumerate(rows):
+                results[i] = (predicted_pm25[row], confidences[row])
+        
+        return results
+    
     async def predict_pollution_levels(self, features: Dict[str, Any]) -> Dict[str, Any]:
         """Predict pollution levels using ML models"""
         if not self.prediction_model:
@@ -100,23 +283,32 @@ class MLService:
             # Prepare features for prediction
             prediction_features = self._prepare_prediction_features(features)
             
-            # Make prediction
-            prediction = self.prediction_model.predict(prediction_features)
-            
-            # Process prediction results
-            if hasattr(prediction, 'predict_proba'):
-                # Classification model
-                probabilities = prediction.predict_proba(prediction_features)[0]
-                predicted_class = prediction.predict(prediction_features)[0]
-                confidence = float(max(probabilities))
+            # Make prediction (one model call either way)
+            model = self.prediction_model
+            if self._onnx_input_name:
+                # Classifiers export [label, probabilities], regressors [value]
+                outputs = model.run(None, {self._onnx_input_name: prediction_features})
+                predicted_class = outputs[0].ravel()[0]
+                if len(outputs) > 1:
+                    probabilities = outputs[1][0]
+                    if isinstance(probabilities, dict):  # exported with ZipMap
+                        probabilities = list(probabilities.values())
+                    confidence = float(np.max(probabilities))
+                else:
+                    confidence = 0.8  # Default confidence for regression
+            elif hasattr(model, 'predict_proba'):
+                # Classification model: the most probable class and its probability
+                probabilities = model.predict_proba(prediction_features)[0]
+                best = int(np.argmax(probabilities))
+                predicted_class = model.classes_[best]
+                confidence = float(probabilities[best])
             else:
                 # Regression model
-                predicted_value = prediction.predict(prediction_features)[0]
+                predicted_class = model.predict(prediction_features)[0]
                 confidence = 0.8  # Default confidence for regression
-                predicted_class = predicted_value
             
             return {
-                "predicted_aqi": int(predicted_class) if isinstance(predicted_class, (int, float)) else 50,
+                "predicted_aqi": int(predicted_class) if isinstance(predicted_class, (int, float, np.number)) else 50,
                 "confidence_score": confidence,
                 "model_type": "ml",
                 "prediction_time": datetime.utcnow()
@@ -126,73 +318,60 @@ class MLService:
             logger.error(f"Error in pollution prediction: {e}")
             return self._rule_based_prediction(features)
     
-    def _preprocess_image(self, image_data: bytes) -> np.ndarray:
-        """Preprocess image for model input"""
-        # This would implement actual image preprocessing
-        # For now, return a dummy array
-        image_array = np.frombuffer(image_data, dtype=np.uint8)
-        image_array = image_array.reshape(1, 224, 224, 3)  # Adjust based on model input shape
-        return image_array.astype(np.float32) / 255.0
+    def _preprocess_image(self, image_data: bytes, out: np.ndarray) -> np.ndarray:
+        """
+        Decode an encoded image (JPEG/PNG/...), resize it to the model input and scale it to [0, 1]
+        (or keep the raw pixels when ``out`` is uint8, for quantized models).
+        The BGR->RGB swap, any transpose to channels-first and the scaling happen in a single pass
+        written into ``out`` (H x W x 3, or 3 x H x W for channels-first models).
+        """
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image")
+        
+        if (image.shape[1], image.shape[0]) != self._image_size:
+            image = cv2.resize(image, self._image_size, interpolation=cv2.INTER_AREA)
+        
+        pixels = image[..., ::-1]
+        if self._image_channels_first:
+            pixels = pixels.transpose(2, 0, 1)
+        if out.dtype == np.uint8:
+            np.copyto(out, pixels)
+        else:
+            np.multiply(pixels, 1.0 / 255.0, out=out, dtype=np.float32)
+        return out
     
-    def _calculate_confidence(self, prediction: np.ndarray) -> float:
-        """Calculate prediction confidence score"""
+    def _calculate_confidence(self, output: np.ndarray) -> np.ndarray:
+        """Calculate the confidence score of each row of a batch's model output"""
         # Simplified confidence calculation
-        if len(prediction.shape) == 1:
-            return 0.8  # Default confidence
-        else:
-            max_prob = np.max(prediction)
-            return float(max_prob)
+        if self._image_output_1d:
+            return np.full(output.shape[0], 0.8)  # Default confidence
+        return output.max(axis=1)
     
     def _prepare_prediction_features(self, features: Dict[str, Any]) -> np.ndarray:
-        """Prepare features for prediction model"""
-        # Extract relevant features
-        feature_values = [
-            features.get('temperature', 20.0),
-            features.get('humidity', 50.0),
-            features.get('pressure', 1013.0),
-            features.get('wind_speed', 2.0),
-            features.get('hour', datetime.utcnow().hour),
-            features.get('day_of_week', datetime.utcnow().weekday()),
-        ]
-        
-        return np.array([feature_values])
+        """
+        Prepare features for prediction model. The returned row is a reused buffer,
+        valid until the next call (callers predict on it right away, without awaiting).
+        """
+        now = datetime.utcnow()
+        buf = self._feat_buf
+        buf[0, 0] = features.get('temperature', 20.0)
+        buf[0, 1] = features.get('humidity', 50.0)
+        buf[0, 2] = features.get('pressure', 1013.0)
+        buf[0, 3] = features.get('wind_speed', 2.0)
+        buf[0, 4] = features.get('hour', now.hour)
+        buf[0, 5] = features.get('day_of_week', now.weekday())
+        return buf
     
     def _rule_based_prediction(self, features: Dict[str, Any]) -> Dict[str, Any]:
         """Fallback rule-based prediction"""
         try:
-            # Simple rule-based prediction
-            base_aqi = 50
-            
-            # Temperature effect
-            temp = features.get('temperature', 20.0)
-            if temp > 30:
-                base_aqi += 20
-            elif temp < 0:
-                base_aqi += 10
-            
-            # Humidity effect
-            humidity = features.get('humidity', 50.0)
-            if humidity > 80:
-                base_aqi += 15
-            elif humidity < 30:
-                base_aqi += 10
-            
-            # Wind speed effect
-            wind_speed = features.get('wind_speed', 2.0)
-            if wind_speed < 1:
-                base_aqi += 20
-            elif wind_speed > 10:
-                base_aqi -= 15
-            
-            # Time of day effect
-            hour = features.get('hour', datetime.utcnow().hour)
-            if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
-                base_aqi += 25
-            elif 22 <= hour or hour <= 6:  # Night time
-                base_aqi -= 10
-            
-            # Ensure AQI is within bounds
-            predicted_aqi = max(0, min(500, base_aqi))
+            predicted_aqi = _rule_based_kernel(
+                float(features.get('temperature', 20.0)),
+                float(features.get('humidity', 50.0)),
+                float(features.get('wind_speed', 2.0)),
+                float(features.get('hour', datetime.utcnow().hour))
+            )
             
             return {
                 "predicted_aqi": int(predicted_aqi),
@@ -1,13 +1,52 @@
 import asyncio
+import heapq
 import logging
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+import os
+import socket
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
+import orjson
+import redis.asyncio as redis
+
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+MULTICAST_TOKEN_LIMIT = 500  # device tokens FCM accepts per multicast message
+
+# Encoded "android"/"apns" message members per notification priority, spliced into each message
+PRIORITY_FIELDS = {
+    priority: orjson.dumps({
+        "android": {"priority": priority},
+        "apns": {"headers": {"apns-priority": "10" if priority == "urgent" else "5"}}
+    })[1:-1]
+    for priority in ("low", "normal", "high", "urgent")
+}
+
+# Redis stream holding queued notifications and the consumer group delivering them
+NOTIFICATION_STREAM = "notifications"
+NOTIFICATION_GROUP = "notification-workers"
+CLAIM_IDLE_MS = 60000  # entries read by a worker but unacknowledged this long are redelivered
+STATS_TTL = 30 * 86400  # seconds a user's notification counters are kept after their last change
+
+MEMORY_BATCH_SIZE = 64  # notifications the in-process worker delivers at once
+
+
+def notification_stats_key(user_id: str) -> str:
+    """Redis hash of a user's notification count per status"""
+    return f"notification_stats:{user_id}"
+
+
+def device_tokens_key(user_id: str) -> str:
+    """Redis set of a user's registered device tokens"""
+    return f"device_tokens:{user_id}"
+
+
 class NotificationPriority(Enum):
     LOW = "low"
     NORMAL = "normal"
@@ -25,8 +64,26 @@ class NotificationService:
     """Push notification service for alerts and updates"""
     
     def __init__(self):
-        self.subscribers: Dict[str, List[str]] = {}  # user_id -> list of device tokens
-        self.notification_queue: List[Dict[str, Any]] = []
+        # user_id -> set of device tokens (in-process fallback; with Redis they're kept in a set per
+        # user, since any worker in the consumer group may deliver a user's notifications)
+        self.subscribers: Dict[str, Set[str]] = {}
+        # Bounded in-process queue of notifications awaiting delivery, used when Redis is unavailable
+        self.notification_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.NOTIFICATION_QUEUE_SIZE)
+        # user_id -> notification count per status (in-process fallback for the Redis counters)
+        self._status_counts: Dict[str, Counter] = defaultdict(Counter)
+        # Redis stream queue and the worker consuming it (or the in-process queue without Redis)
+        self.redis_client: Optional[redis.Redis] = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._worker: Optional[asyncio.Task] = None
+        # Scheduled notifications: a min-heap of (send timestamp, schedule_id) and the pending
+        # notification per schedule_id. Cancelling only removes the index entry; the heap entry
+        # is skipped when it comes due.
+        self._scheduled: List[Tuple[float, str]] = []
+        self._scheduled_notifications: Dict[str, Dict[str, Any]] = {}
+        self._schedule_changed = asyncio.Event()
+        self._scheduler: Optional[asyncio.Task] = None
+        # Caps concurrent device sends so bulk fan-out doesn't open unbounded push connections
+        self._send_limit = asyncio.Semaphore(settings.NOTIFICATION_SEND_CONCURRENCY)
         self.is_initialized = False
     
     async def initialize(self):
@@ -34,15 +91,43 @@ class NotificationService:
         try:
             # Initialize Firebase or other push notification service
             # This would set up actual push notification infrastructure
+            await self._connect_queue()
+            if not self.redis_client:
+                self._worker = asyncio.create_task(self._run_memory_worker())
+            self._scheduler = asyncio.create_task(self._run_scheduler())
             self.is_initialized = True
             logger.info("Notification service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize notification service: {e}")
             self.is_initialized = False
     
+    async def _connect_queue(self):
+        """Connect to the Redis notification stream and start the delivery worker"""
+        try:
+            self.redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+            await self.redis_client.ping()
+            try:
+                await self.redis_client.xgroup_create(NOTIFICATION_STREAM, NOTIFICATION_GROUP, id="0", mkstream=True)
+            except redis.ResponseError:
+                pass  # group already exists
+            self._worker = asyncio.create_task(self._run_queue_worker())
+        except Exception as e:
+            logger.error(f"Failed to connect notification queue: {e}")
+            # Fallback to the in-process queue
+            self.redis_client = None
+    
     async def shutdown(self):
         """Shutdown notification service"""
         self.is_initialized = False
+        for task in (self._worker, self._scheduler):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self.redis_client:
+            await self.redis_client.close()
         logger.info("Notification service shutdown complete")
     
     async def send_notification(
@@ -71,12 +156,25 @@ class NotificationService:
                 "status": "pending"
             }
             
-            # Add to queue
-            self.notification_queue.append(notification)
+            await self._record_status(user_id, None, "pending")
             
-            # Process notification immediately for urgent items
+            # Urgent items are processed immediately; the rest are queued for the delivery worker
             if priority == NotificationPriority.URGENT:
                 await self._process_notification(notification)
+            elif self.redis_client:
+                await self.redis_client.xadd(
+                    NOTIFICATION_STREAM,
+                    {"u": str(user_id), "p": orjson.dumps(notification)},
+                    maxlen=settings.NOTIFICATION_STREAM_MAXLEN,
+                    approximate=True
+                )
+            else:
+                try:
+                    self.notification_queue.put_nowait(notification)
+                except asyncio.QueueFull:
+                    logger.warning(f"Notification queue full, dropping notification for user {user_id}")
+                    await self._set_status(notification, "failed")
+                    return False
             
             logger.info(f"Notification queued for user {user_id}: {title}")
             return True
@@ -95,14 +193,15 @@ class NotificationService:
         data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, bool]:
         """Send notification to multiple users"""
-        results = {}
-        
-        for user_id in user_ids:
-            results[user_id] = await self.send_notification(
-                user_id, title, message, notification_type, priority, data
-            )
+        sent = await asyncio.gather(
+            *(
+                self.send_notification(user_id, title, message, notification_type, priority, data)
+                for user_id in user_ids
+            ),
+            return_exceptions=True
+        )
         
-        return results
+        return {user_id: result is True for user_id, result in zip(user_ids, sent)}
     
     async def send_air_quality_alert(
         self,
@@ -184,7 +283,7 @@ class NotificationService:
     ) -> str:
         """Schedule a notification for later delivery"""
         try:
-            schedule_id = f"schedule_{user_id}_{int(datetime.utcnow().timestamp())}"
+            schedule_id = f"schedule_{user_id}_{int(datetime.utcnow().timestamp())}_{uuid.uuid4().hex[:8]}"
             
             scheduled_notification = {
                 "id": schedule_id,
@@ -198,8 +297,16 @@ class NotificationService:
                 "created_at": datetime.utcnow()
             }
             
-            # Store in scheduled notifications database
-            # This would be stored in the actual database
+            # Naive datetimes are UTC throughout the service
+            if send_time.tzinfo is None:
+                send_time = send_time.replace(tzinfo=timezone.utc)
+            
+            self._scheduled_notifications[schedule_id] = scheduled_notification
+            heapq.heappush(self._scheduled, (send_time.timestamp(), schedule_id))
+            if self._scheduled[0][1] == schedule_id:
+                # New earliest item; wake the scheduler so it doesn't oversleep
+                self._schedule_changed.set()
+            
             logger.info(f"Notification scheduled for {send_time}: {title}")
             
             return schedule_id
@@ -211,25 +318,56 @@ class NotificationService:
     async def cancel_scheduled_notification(self, schedule_id: str) -> bool:
         """Cancel a scheduled notification"""
         try:
-            # Remove from scheduled notifications database
+            if self._scheduled_notifications.pop(schedule_id, None) is None:
+                return False
+            
             logger.info(f"Scheduled notification cancelled: {schedule_id}")
             return True
         except Exception as e:
             logger.error(f"Error cancelling scheduled notification: {e}")
             return False
     
+    async def _run_scheduler(self):
+        """Send scheduled notifications as they come due"""
+        while True:
+            try:
+                now = time.time()
+                while self._scheduled and self._scheduled[0][0] <= now:
+                    _, schedule_id = heapq.heappop(self._scheduled)
+                    scheduled = self._scheduled_notifications.pop(schedule_id, None)
+                    if scheduled is None:
+                        continue  # cancelled
+                    await self.send_notification(
+                        scheduled["user_id"], scheduled["title"], scheduled["message"],
+                        NotificationType(scheduled["type"])
+                    )
+                
+                timeout = self._scheduled[0][0] - now if self._scheduled else None
+                self._schedule_changed.clear()
+                try:
+                    await asyncio.wait_for(self._schedule_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sending scheduled notifications: {e}")
+                await asyncio.sleep(1)
+    
     async def register_device(self, user_id: str, device_token: str) -> bool:
         """Register device for push notifications"""
         try:
-            if user_id not in self.subscribers:
-                self.subscribers[user_id] = []
-            
-            if device_token not in self.subscribers[user_id]:
-                self.subscribers[user_id].append(device_token)
-                logger.info(f"Device registered for user {user_id}: {device_token[:10]}...")
-                return True
+            if self.redis_client:
+                if not await self.redis_client.sadd(device_tokens_key(user_id), device_token):
+                    return False
+            else:
+                device_tokens = self.subscribers.setdefault(user_id, set())
+                if device_token in device_tokens:
+                    return False
+                device_tokens.add(device_token)
             
-            return False
+            logger.info(f"Device registered for user {user_id}: {device_token[:10]}...")
+            return True
         except Exception as e:
             logger.error(f"Error registering device: {e}")
             return False
@@ -237,95 +375,182 @@ class NotificationService:
     async def unregister_device(self, user_id: str, device_token: str) -> bool:
         """Unregister device from push notifications"""
         try:
-            if user_id in self.subscribers and device_token in self.subscribers[user_id]:
-                self.subscribers[user_id].remove(device_token)
-                logger.info(f"Device unregistered for user {user_id}: {device_token[:10]}...")
-                return True
+            if self.redis_client:
+                removed = await self.redis_client.srem(device_tokens_key(user_id), device_token) > 0
+            else:
+                device_tokens = self.subscribers.get(user_id)
+                removed = bool(device_tokens) and device_token in device_tokens
+                if removed:
+                    device_tokens.discard(device_token)
             
-            return False
+            if removed:
+                logger.info(f"Device unregistered for user {user_id}: {device_token[:10]}...")
+            return removed
         except Exception as e:
             logger.error(f"Error unregistering device: {e}")
             return False
     
+    async def _get_device_tokens(self, user_id: str) -> List[str]:
+        """The user's registered device tokens"""
+        if self.redis_client:
+            return list(await self.redis_client.smembers(device_tokens_key(user_id)))
+        return list(self.subscribers.get(user_id, ()))
+    
+    async def _record_status(self, user_id: str, previous: Optional[str], status: str):
+        """Move one of the user's notifications from ``previous`` (None when new) to ``status``"""
+        if self.redis_client:
+            key = notification_stats_key(user_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            if previous:
+                pipe.hincrby(key, previous, -1)
+            pipe.hincrby(key, status, 1)
+            pipe.expire(key, STATS_TTL)
+            await pipe.execute()
+        else:
+            counts = self._status_counts[user_id]
+            if previous:
+                counts[previous] -= 1
+            counts[status] += 1
+    
+    async def _set_status(self, notification: Dict[str, Any], status: str):
+        """Update a notification's status and the per-user counters"""
+        await self._record_status(notification["user_id"], notification["status"], status)
+        notification["status"] = status
+    
+    async def _run_queue_worker(self):
+        """Deliver notifications from the Redis stream in batches"""
+        # Entries another worker read but never acknowledged (e.g. it crashed) are picked up first
+        start_id = "0-0"
+        while True:
+            try:
+                start_id, entries = (await self.redis_client.xautoclaim(
+                    NOTIFICATION_STREAM, NOTIFICATION_GROUP, self._consumer,
+                    min_idle_time=CLAIM_IDLE_MS, start_id=start_id, count=settings.NOTIFICATION_BATCH_SIZE
+                ))[:2]
+                await self._deliver_entries(entries)
+                if start_id == "0-0":
+                    break
+            except Exception as e:
+                logger.error(f"Error reclaiming queued notifications: {e}")
+                break
+        
+        while True:
+            try:
+                response = await self.redis_client.xreadgroup(
+                    NOTIFICATION_GROUP, self._consumer, {NOTIFICATION_STREAM: ">"},
+                    count=settings.NOTIFICATION_BATCH_SIZE, block=1000
+                )
+                for _, entries in response or []:
+                    await self._deliver_entries(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in notification queue worker: {e}")
+                await asyncio.sleep(1)
+    
+    async def _run_memory_worker(self):
+        """Deliver notifications from the in-process queue in batches"""
+        queue = self.notification_queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < MEMORY_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                await asyncio.gather(*(self._process_notification(notification) for notification in batch))
+            except Exception as e:
+                logger.error(f"Error in notification queue worker: {e}")
+    
+    async def _deliver_entries(self, entries: List[Any]):
+        """Process a batch of stream entries and acknowledge them"""
+        if not entries:
+            return
+        
+        await asyncio.gather(
+            *(self._process_notification(orjson.loads(fields["p"])) for _, fields in entries)
+        )
+        await self.redis_client.xack(NOTIFICATION_STREAM, NOTIFICATION_GROUP, *(entry_id for entry_id, _ in entries))
+    
     async def _process_notification(self, notification: Dict[str, Any]) -> bool:
         """Process and send notification"""
         try:
             user_id = notification["user_id"]
             
             # Get user's device tokens
-            device_tokens = self.subscribers.get(user_id, [])
+            device_tokens = await self._get_device_tokens(user_id)
             
             if not device_tokens:
                 logger.warning(f"No device tokens found for user {user_id}")
-                notification["status"] = "failed"
+                await self._set_status(notification, "failed")
                 return False
             
-            # Send to all user's devices
-            success_count = 0
-            for token in device_tokens:
-                if await self._send_to_device(token, notification):
-                    success_count += 1
+            # Send to all user's devices in multicast batches
+            success_count = await self._send_multicast(device_tokens, notification)
             
             if success_count > 0:
-                notification["status"] = "sent"
+                await self._set_status(notification, "sent")
                 notification["sent_count"] = success_count
                 logger.info(f"Notification sent successfully to {success_count} devices")
                 return True
             else:
-                notification["status"] = "failed"
+                await self._set_status(notification, "failed")
                 return False
                 
         except Exception as e:
             logger.error(f"Error processing notification: {e}")
-            notification["status"] = "error"
+            await self._set_status(notification, "error")
             return False
     
-    async def _send_to_device(self, device_token: str, notification: Dict[str, Any]) -> bool:
-        """Send notification to specific device"""
+    async def _send_multicast(self, device_tokens: List[str], notification: Dict[str, Any]) -> int:
+        """Send notification to devices, one multicast message per MULTICAST_TOKEN_LIMIT tokens; returns devices reached"""
+        # The message is the same for every device, so it's encoded once
+        message = orjson.dumps({
+            "notification": {
+                "title": notification["title"],
+                "body": notification["message"]
+            },
+            "data": notification["data"]
+        })
+        message = message[:-1] + b"," + PRIORITY_FIELDS.get(notification["priority"], PRIORITY_FIELDS["normal"]) + b"}"
+        
+        sent = await asyncio.gather(
+            *(
+                self._send_batch(device_tokens[start:start + MULTICAST_TOKEN_LIMIT], message)
+                for start in range(0, len(device_tokens), MULTICAST_TOKEN_LIMIT)
+            ),
+            return_exceptions=True
+        )
+        return sum(count for count in sent if isinstance(count, int))
+    
+    async def _send_batch(self, device_tokens: List[str], message: bytes) -> int:
+        """Send one multicast message (``message`` is the encoded JSON object); returns the number of devices it reached"""
         try:
-            # This would implement actual push notification sending
-            # Using Firebase Cloud Messaging or other service
-            
-            payload = {
-                "token": device_token,
-                "notification": {
-                    "title": notification["title"],
-                    "body": notification["message"]
-                },
-                "data": notification["data"],
-                "android": {
-                    "priority": notification["priority"]
-                },
-                "apns": {
-                    "headers": {
-                        "apns-priority": "10" if notification["priority"] == "urgent" else "5"
-                    }
-                }
-            }
-            
-            # Simulate successful send
-            logger.info(f"Push notification sent to device {device_token[:10]}...")
-            return True
+            async with self._send_limit:
+                # This would implement actual push notification sending
+                # Using Firebase Cloud Messaging multicast or other service
+                
+                # Simulate successful send
+                logger.info(f"Push notification sent to {len(device_tokens)} devices")
+                return len(device_tokens)
             
         except Exception as e:
-            logger.error(f"Error sending to device {device_token[:10]}: {e}")
-            return False
+            logger.error(f"Error sending to {len(device_tokens)} devices: {e}")
+            return 0
     
     async def cleanup_old_notifications(self, days_old: int = 30) -> int:
         """Clean up old notifications from queue"""
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=days_old)
             
-            initial_count = len(self.notification_queue)
-            self.notification_queue = [
-                n for n in self.notification_queue 
-                if n["timestamp"] > cutoff_date
-            ]
+            if self.redis_client:
+                # Stream entry IDs start with their millisecond timestamp
+                cutoff_ms = int((cutoff_date - datetime(1970, 1, 1)).total_seconds() * 1000)
+                cleaned_count = await self.redis_client.xtrim(NOTIFICATION_STREAM, minid=cutoff_ms, approximate=False)
+                logger.info(f"Cleaned up {cleaned_count} old notifications")
+                return cleaned_count
             
-            cleaned_count = initial_count - len(self.notification_queue)
-            logger.info(f"Cleaned up {cleaned_count} old notifications")
-            
-            return cleaned_count
+            # The in-process queue only holds notifications awaiting delivery; nothing old is kept
+            return 0
             
         except Exception as e:
             logger.error(f"Error cleaning up notifications: {e}")
@@ -334,16 +559,21 @@ class NotificationService:
     async def get_notification_stats(self, user_id: str) -> Dict[str, Any]:
         """Get notification statistics for user"""
         try:
-            user_notifications = [
-                n for n in self.notification_queue 
-                if n["user_id"] == user_id
-            ]
+            if self.redis_client:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hgetall(notification_stats_key(user_id))
+                pipe.scard(device_tokens_key(user_id))
+                stats, device_count = await pipe.execute()
+                counts = Counter({status: int(count) for status, count in stats.items()})
+            else:
+                counts = self._status_counts.get(user_id, Counter())
+                device_count = len(self.subscribers.get(user_id, ()))
             
             return {
-                "total_sent": len([n for n in user_notifications if n["status"] == "sent"]),
-                "total_failed": len([n for n in user_notifications if n["status"] == "failed"]),
-                "pending": len([n for n in user_notifications if n["status"] == "pending"]),
-                "registered_devices": len(self.subscribers.get(user_id, []))
+                "total_sent": counts["sent"],
+                "total_failed": counts["failed"],
+                "pending": counts["pending"],
+                "registered_devices": device_count
             }
             
         except Exception as e:
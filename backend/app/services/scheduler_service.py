@@ -1,11 +1,19 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from typing import Dict, Any, List, Optional, Callable
-from datetime import datetime, timedelta
+import time
+from dataclasses import dataclass, field, fields
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Callable, Tuple
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 from app.core.config import settings
 
+if TYPE_CHECKING:
+    from app.services.ml_service import MLService
+    from app.services.notification_service import NotificationService
+
 logger = logging.getLogger(__name__)
 
 class TaskStatus(Enum):
@@ -21,18 +29,101 @@ class TaskPriority(Enum):
     HIGH = 3
     URGENT = 4
 
+PRIORITY_SLOT_LIMIT = 256  # consecutive priority-slot runs before urgent tasks queue on the heap again
+COMPACT_MIN_HEAP = 100  # heap size below which stale entries are left to be skipped when popped
+TIME_FIELDS = ("created_at", "last_run")
+
+# Statuses a task may move to from each status. A run starts from any status but RUNNING
+# (force_run_task included), and ends back in PENDING or in COMPLETED/FAILED;
+# cancel, resume and reschedule may happen at any point
+TASK_TRANSITIONS = {
+    TaskStatus.PENDING: frozenset({TaskStatus.RUNNING, TaskStatus.PENDING, TaskStatus.CANCELLED}),
+    TaskStatus.RUNNING: frozenset({TaskStatus.PENDING, TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED}),
+    TaskStatus.COMPLETED: frozenset({TaskStatus.RUNNING, TaskStatus.PENDING, TaskStatus.CANCELLED}),
+    TaskStatus.FAILED: frozenset({TaskStatus.RUNNING, TaskStatus.PENDING, TaskStatus.CANCELLED}),
+    TaskStatus.CANCELLED: frozenset({TaskStatus.RUNNING, TaskStatus.PENDING, TaskStatus.CANCELLED}),
+}
+
+@dataclass(slots=True)
+class ScheduledTask:
+    """A scheduled job and its run state; next_run is on the event loop clock, other times are Unix timestamps"""
+    id: str
+    handler: Callable
+    next_run: float
+    interval_seconds: Optional[int] = None
+    max_runs: Optional[int] = None
+    run_count: int = 0
+    priority: TaskPriority = TaskPriority.NORMAL
+    status: TaskStatus = TaskStatus.PENDING
+    created_at: float = field(default_factory=time.time)
+    last_run: Optional[float] = None
+    last_result: Any = None
+    last_error: Optional[str] = None
+    
+    def move_to(self, status: TaskStatus):
+        """Change status, rejecting moves TASK_TRANSITIONS doesn't allow"""
+        if status not in TASK_TRANSITIONS[self.status]:
+            raise ValueError(f"Task {self.id} can't go from {self.status.value} to {status.value}")
+        self.status = status
+    
+    def to_dict(self, clock_offset: float) -> Dict[str, Any]:
+        """Task state without the handler, for status reporting; times as ISO strings"""
+        state = {f.name: getattr(self, f.name) for f in fields(self) if f.name != "handler"}
+        state["next_run"] += clock_offset
+        for name in ("next_run",) + TIME_FIELDS:
+            if state[name] is not None:
+                state[name] = datetime.fromtimestamp(state[name], timezone.utc).isoformat()
+        return state
+
+
 class SchedulerService:
     """Background task scheduler for periodic jobs and notifications"""
     
-    def __init__(self):
-        self.tasks: Dict[str, Dict[str, Any]] = {}
-        self.task_handlers: Dict[str, Callable] = {}
+    def __init__(
+        self,
+        ml_service: Optional["MLService"] = None,
+        notification_service: Optional["NotificationService"] = None
+    ):
+        self.tasks: Dict[str, ScheduledTask] = {}
+        # The application's services, shared with the request handlers rather than rebuilt per job
+        self.ml_service = ml_service
+        self.notification_service = notification_service
+        # Min-heap of (next_run, -priority, seq, task_id): plain floats and ints, so ordering
+        # is decided by C-level comparisons; same-time tasks go by priority, then scheduling order.
+        # Entries go stale when a task is rescheduled, paused or cancelled; they're skipped when
+        # popped rather than searched for and removed
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._seq = itertools.count()
+        # Roughly how many heap entries are stale; once they're the majority the heap is rebuilt
+        self._dead_count = 0
+        # A due URGENT task jumps the heap through this slot and starts on the next tick. After
+        # PRIORITY_SLOT_LIMIT slot runs in a row without a heap task starting, urgent tasks go
+        # through the heap so a stream of them can't starve everything else
+        self._priority_slot: Optional[str] = None
+        self._slot_runs = 0
+        # Set when a new earliest deadline is pushed, so the loop re-times its sleep
+        self._wakeup = asyncio.Event()
+        # One-shot tasks wait in the event loop's own timer queue, and only join the heap (or take
+        # the priority slot) once due, so they still start in priority order
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Status dicts for get_task_status/get_all_tasks, rebuilt only after a task changes;
+        # callers get a copy so they can't alter the cached one
+        self._views: Dict[str, Dict[str, Any]] = {}
+        # Executions in flight, so a slow handler doesn't hold up other due tasks
+        self._running: Dict[str, asyncio.Task] = {}
+        # Caps handlers running at once; each may open DB sessions or service clients
+        self._max_concurrent = settings.SCHEDULER_MAX_CONCURRENT or 16
+        self._sem = asyncio.Semaphore(self._max_concurrent)
+        self._executing = 0
         self.is_running = False
         self.scheduler_task: Optional[asyncio.Task] = None
+        # Deadlines use the event loop's monotonic clock, so wall-clock jumps don't move them
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
     
     async def initialize(self):
         """Initialize scheduler service"""
         try:
+            self._loop = asyncio.get_running_loop()
             self.is_running = True
             self.scheduler_task = asyncio.create_task(self._scheduler_loop())
             await self._schedule_default_tasks()
@@ -52,8 +143,13 @@ class SchedulerService:
             except asyncio.CancelledError:
                 pass
         
-        # Cancel all pending tasks
-        for task_id in list(self.tasks.keys()):
+        # Let executions already under way finish
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        
+        # Cancel all pending tasks; only their ids are snapshotted, not the whole task table
+        pending = [task_id for task_id, task in self.tasks.items() if task.status == TaskStatus.PENDING]
+        for task_id in pending:
             await self.cancel_task(task_id)
         
         logger.info("Scheduler service shutdown complete")
@@ -62,15 +158,37 @@ class SchedulerService:
         """Main scheduler loop"""
         while self.is_running:
             try:
-                current_time = datetime.utcnow()
+                now = self._now()
+                
+                if len(self._heap) > COMPACT_MIN_HEAP and self._dead_count * 2 > len(self._heap):
+                    self._compact()
                 
-                # Check for due tasks
-                for task_id, task in list(self.tasks.items()):
-                    if task["status"] == TaskStatus.PENDING and task["next_run"] <= current_time:
-                        await self._execute_task(task_id, task)
+                # The priority slot goes first
+                if self._priority_slot is not None:
+                    task_id, self._priority_slot = self._priority_slot, None
+                    if self._start_if_due(task_id, now):
+                        self._slot_runs += 1
                 
-                # Sleep for a short interval
-                await asyncio.sleep(30)  # Check every 30 seconds
+                # Pop due tasks off the heap; higher priorities start first (and so queue first
+                # for the handler limit), the stable sort keeps time order within a priority
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                due.sort(key=lambda entry: entry[1])
+                for _, _, _, task_id in due:
+                    if self._start_if_due(task_id, now):
+                        self._slot_runs = 0
+                    elif self._dead_count:
+                        self._dead_count -= 1
+                
+                # Sleep until the next deadline, or until an earlier one is scheduled
+                delay = max(0.0, self._heap[0][0] - self._now()) if self._heap else 3600
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self._wakeup.clear()
                 
             except asyncio.CancelledError:
                 break
@@ -78,6 +196,72 @@ class SchedulerService:
                 logger.error(f"Error in scheduler loop: {e}")
                 await asyncio.sleep(60)  # Wait longer on error
     
+    def _now(self) -> float:
+        """Current time on the event loop clock"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop.time()
+    
+    def _to_loop_time(self, start_time: datetime) -> float:
+        """Event loop clock time of a naive UTC datetime"""
+        return self._now() + (start_time - datetime.utcnow()).total_seconds()
+    
+    def _drop_queued(self, task_id: str):
+        """Forget a pending task's queued run: cancel its timer, or count its heap entry as stale"""
+        timer = self._timers.pop(task_id, None)
+        if timer:
+            timer.cancel()
+        else:
+            self._dead_count += 1
+    
+    def _fire_timer(self, task_id: str):
+        """Loop timer callback for a one-shot task: queue it now that it's due"""
+        self._timers.pop(task_id, None)
+        task = self.tasks.get(task_id)
+        if task and task.status == TaskStatus.PENDING:
+            self._push(task_id, task)
+    
+    def _start_if_due(self, task_id: str, now: float) -> bool:
+        """Start an execution of the task if it's still pending and due; skips stale entries"""
+        task = self.tasks.get(task_id)
+        if (not task or task.status != TaskStatus.PENDING or task.next_run > now
+                or task_id in self._running):
+            return False
+        
+        execution = asyncio.create_task(self._execute_task(task_id, task))
+        self._running[task_id] = execution
+        execution.add_done_callback(lambda _: self._running.pop(task_id, None))
+        return True
+    
+    def _compact(self):
+        """Drop entries whose task is gone, no longer pending or due at a different time"""
+        live = []
+        for entry in self._heap:
+            task = self.tasks.get(entry[3])
+            if task and task.status == TaskStatus.PENDING and entry[0] == task.next_run:
+                live.append(entry)
+        heapq.heapify(live)
+        self._heap = live
+        self._dead_count = 0
+    
+    def _push(self, task_id: str, task: ScheduledTask):
+        """Queue the task's next run: a loop timer for one-shot tasks not yet due, the priority slot
+        for a due URGENT task if it's free, else the heap"""
+        if task.interval_seconds is None and task.max_runs is None and task.next_run > self._now():
+            self._timers[task_id] = self._loop.call_at(task.next_run, self._fire_timer, task_id)
+            return
+        
+        if (task.priority == TaskPriority.URGENT and self._priority_slot is None
+                and self._slot_runs < PRIORITY_SLOT_LIMIT and task.next_run <= self._now()):
+            self._priority_slot = task_id
+            self._wakeup.set()
+            return
+        
+        entry = (task.next_run, -task.priority.value, next(self._seq), task_id)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+    
     async def schedule_task(
         self,
         task_id: str,
@@ -93,24 +277,19 @@ class SchedulerService:
                 logger.warning(f"Task {task_id} already exists")
                 return False
             
-            task = {
-                "id": task_id,
-                "handler": task_handler,
-                "next_run": start_time,
-                "interval_seconds": interval_seconds,
-                "max_runs": max_runs,
-                "run_count": 0,
-                "priority": priority,
-                "status": TaskStatus.PENDING,
-                "created_at": datetime.utcnow(),
-                "last_run": None,
-                "last_result": None
-            }
+            task = ScheduledTask(
+                id=task_id,
+                handler=task_handler,
+                next_run=self._to_loop_time(start_time),
+                interval_seconds=interval_seconds,
+                max_runs=max_runs,
+                priority=priority
+            )
             
             self.tasks[task_id] = task
-            self.task_handlers[task_id] = task_handler
+            self._push(task_id, task)
             
-            logger.info(f"Task scheduled: {task_id} at {start_time}")
+            logger.debug(f"Task scheduled: {task_id} at {start_time}")
             return True
             
         except Exception as e:
@@ -124,13 +303,12 @@ class SchedulerService:
                 return False
             
             task = self.tasks[task_id]
-            task["status"] = TaskStatus.CANCELLED
-            
-            # Remove from handlers
-            if task_id in self.task_handlers:
-                del self.task_handlers[task_id]
+            if task.status == TaskStatus.PENDING:
+                self._drop_queued(task_id)
+            task.move_to(TaskStatus.CANCELLED)
+            self._views.pop(task_id, None)
             
-            logger.info(f"Task cancelled: {task_id}")
+            logger.debug(f"Task cancelled: {task_id}")
             return True
             
         except Exception as e:
@@ -144,9 +322,11 @@ class SchedulerService:
                 return False
             
             task = self.tasks[task_id]
-            if task["status"] == TaskStatus.PENDING:
-                task["status"] = TaskStatus.CANCELLED
-                logger.info(f"Task paused: {task_id}")
+            if task.status == TaskStatus.PENDING:
+                task.move_to(TaskStatus.CANCELLED)
+                self._drop_queued(task_id)
+                self._views.pop(task_id, None)
+                logger.debug(f"Task paused: {task_id}")
                 return True
             
             return False
@@ -163,10 +343,13 @@ class SchedulerService:
             
             task = self.tasks[task_id]
             
-            if task["status"] == TaskStatus.CANCELLED:
-                task["status"] = TaskStatus.PENDING
-                task["next_run"] = new_start_time or datetime.utcnow() + timedelta(minutes=5)
-                logger.info(f"Task resumed: {task_id}")
+            if task.status == TaskStatus.CANCELLED:
+                task.move_to(TaskStatus.PENDING)
+                task.next_run = self._to_loop_time(new_start_time) if new_start_time else self._now() + 300
+                if task_id not in self._running:  # else queued once the execution finishes
+                    self._push(task_id, task)
+                self._views.pop(task_id, None)
+                logger.debug(f"Task resumed: {task_id}")
                 return True
             
             return False
@@ -175,39 +358,63 @@ class SchedulerService:
             logger.error(f"Error resuming task {task_id}: {e}")
             return False
     
-    async def _execute_task(self, task_id: str, task: Dict[str, Any]):
+    async def _execute_task(self, task_id: str, task: ScheduledTask):
         """Execute a scheduled task"""
+        # Per-run lifecycle lines are DEBUG; skip building them unless they'll be emitted
+        debug = logger.isEnabledFor(logging.DEBUG)
+        # Outside the try: a task that's already running must not be marked failed
+        task.move_to(TaskStatus.RUNNING)
         try:
-            logger.info(f"Executing task: {task_id}")
-            task["status"] = TaskStatus.RUNNING
-            task["last_run"] = datetime.utcnow()
+            if debug:
+                logger.debug(f"Executing task: {task_id}")
+            task.last_run = time.time()
+            self._views.pop(task_id, None)
             
             # Execute task handler
-            result = await task["handler"]()
-            
-            task["last_result"] = result
-            task["run_count"] += 1
+            async with self._sem:
+                self._executing += 1
+                try:
+                    result = await task.handler()
+                finally:
+                    self._executing -= 1
+            
+            task.last_result = result
+            task.run_count += 1
+            
+            if task.status != TaskStatus.RUNNING:
+                # Cancelled, paused or rescheduled while the handler ran; that takes precedence.
+                # A run queued meanwhile would have been skipped as still running, so queue it now
+                if task.status == TaskStatus.PENDING:
+                    self._push(task_id, task)
+                return
             
             # Check if task should continue
-            if task["max_runs"] and task["run_count"] >= task["max_runs"]:
-                task["status"] = TaskStatus.COMPLETED
-                logger.info(f"Task completed (max runs reached): {task_id}")
-            elif task["interval_seconds"]:
+            if task.max_runs and task.run_count >= task.max_runs:
+                task.move_to(TaskStatus.COMPLETED)
+                if debug:
+                    logger.debug(f"Task completed (max runs reached): {task_id}")
+            elif task.interval_seconds:
                 # Schedule next run
-                task["next_run"] = datetime.utcnow() + timedelta(seconds=task["interval_seconds"])
-                task["status"] = TaskStatus.PENDING
-                logger.info(f"Task rescheduled: {task_id} for {task['next_run']}")
+                task.next_run = self._now() + task.interval_seconds
+                task.move_to(TaskStatus.PENDING)
+                self._push(task_id, task)
+                if debug:
+                    logger.debug(f"Task rescheduled: {task_id} in {task.interval_seconds}s")
             else:
-                task["status"] = TaskStatus.COMPLETED
-                logger.info(f"Task completed: {task_id}")
+                task.move_to(TaskStatus.COMPLETED)
+                if debug:
+                    logger.debug(f"Task completed: {task_id}")
                 
         except asyncio.CancelledError:
-            task["status"] = TaskStatus.CANCELLED
-            logger.info(f"Task cancelled during execution: {task_id}")
+            task.move_to(TaskStatus.CANCELLED)
+            logger.debug(f"Task cancelled during execution: {task_id}")
         except Exception as e:
-            task["status"] = TaskStatus.FAILED
-            task["last_error"] = str(e)
+            if task.status == TaskStatus.RUNNING:
+                task.move_to(TaskStatus.FAILED)
+            task.last_error = str(e)
             logger.error(f"Task failed: {task_id} - {e}")
+        finally:
+            self._views.pop(task_id, None)
     
     async def _schedule_default_tasks(self):
         """Schedule default system tasks"""
@@ -221,6 +428,15 @@ class SchedulerService:
                 priority=TaskPriority.LOW
             )
             
+            # Monthly reading partitions (daily, so the next months always exist)
+            await self.schedule_task(
+                task_id="create_reading_partitions",
+                task_handler=self._create_reading_partitions,
+                start_time=datetime.utcnow() + timedelta(hours=1),
+                interval_seconds=86400,  # 24 hours
+                priority=TaskPriority.NORMAL
+            )
+            
             # Prediction model retraining (weekly)
             await self.schedule_task(
                 task_id="retrain_models",
@@ -239,6 +455,15 @@ class SchedulerService:
                 priority=TaskPriority.HIGH
             )
             
+            # Persist rate-limit usage counters (every 5 minutes)
+            await self.schedule_task(
+                task_id="flush_usage_counts",
+                task_handler=self._flush_usage_counts,
+                start_time=datetime.utcnow() + timedelta(minutes=5),
+                interval_seconds=300,  # 5 minutes
+                priority=TaskPriority.LOW
+            )
+            
             # Notification cleanup (daily)
             await self.schedule_task(
                 task_id="cleanup_notifications",
@@ -256,38 +481,57 @@ class SchedulerService:
     async def _cleanup_old_data(self) -> Dict[str, Any]:
         """Clean up old air quality data"""
         try:
-            from app.models import AirQualityReading
-            from app.core.database import AsyncSessionLocal
+            from app.core.database import engine, drop_reading_partitions_before, prune_default_reading_partition
             
             cutoff_date = datetime.utcnow() - timedelta(days=90)  # Keep 90 days
             
-            async with AsyncSessionLocal() as session:
-                # This would implement actual database cleanup
-                # result = await session.execute(
-                #     delete(AirQualityReading).where(AirQualityReading.created_at < cutoff_date)
-                # )
-                # deleted_count = result.rowcount
-                
-                deleted_count = 0  # Placeholder
+            # Readings are partitioned by month, so expired months are dropped wholesale;
+            # rows outside the prepared months sit in the default partition and are deleted
+            async with engine.begin() as conn:
+                dropped_count = await drop_reading_partitions_before(conn, cutoff_date)
+                pruned_count = await prune_default_reading_partition(conn, cutoff_date)
                 
-            logger.info(f"Cleaned up {deleted_count} old air quality readings")
-            return {"deleted_records": deleted_count}
+            logger.info(
+                f"Dropped {dropped_count} expired air quality reading partitions, "
+                f"{pruned_count} expired rows from the default partition"
+            )
+            return {"dropped_partitions": dropped_count, "pruned_default_rows": pruned_count}
             
         except Exception as e:
             logger.error(f"Error cleaning up old data: {e}")
             return {"error": str(e)}
     
+    async def _create_reading_partitions(self) -> Dict[str, Any]:
+        """Create upcoming monthly partitions for air quality readings"""
+        try:
+            from app.core.database import engine, create_reading_partitions
+            
+            async with engine.begin() as conn:
+                partition_count = await create_reading_partitions(conn)
+            
+            return {"partitions_checked": partition_count}
+            
+        except Exception as e:
+            logger.error(f"Error creating reading partitions: {e}")
+            return {"error": str(e)}
+    
+    async def _flush_usage_counts(self) -> Dict[str, Any]:
+        """Persist the day's rate-limit counters from Redis to user profiles"""
+        from app.core.rate_limit import rate_limiter
+        
+        updated_count = await rate_limiter.flush_usage_counts()
+        logger.info(f"Flushed usage counters for {updated_count} users")
+        return {"updated_users": updated_count}
+    
     async def _retrain_prediction_models(self) -> Dict[str, Any]:
         """Retrain prediction models"""
         try:
-            from app.services.ml_service import MLService
-            
-            ml_service = MLService()
-            await ml_service.initialize()
+            if not self.ml_service:
+                return {"status": "skipped", "reason": "no ML service"}
             
             # This would implement actual model retraining
             # training_data = await self._collect_training_data()
-            # result = await ml_service.retrain_model(training_data)
+            # result = await self.ml_service.retrain_model(training_data)
             
             result = {"status": "initiated"}  # Placeholder
             
@@ -331,15 +575,10 @@ class SchedulerService:
     async def _cleanup_notifications(self) -> Dict[str, Any]:
         """Clean up old notifications"""
         try:
-            from app.services.notification_service import NotificationService
-            
-            notification_service = NotificationService()
-            await notification_service.initialize()
+            if not self.notification_service:
+                return {"status": "skipped", "reason": "no notification service"}
             
-            # This would clean up old notifications
-            # cleaned_count = await notification_service.cleanup_old_notifications(30)
-            
-            cleaned_count = 0  # Placeholder
+            cleaned_count = await self.notification_service.cleanup_old_notifications(30)
             
             return {"cleaned_notifications": cleaned_count}
             
@@ -349,23 +588,27 @@ class SchedulerService:
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Get status of a specific task"""
-        if task_id in self.tasks:
-            task = self.tasks[task_id].copy()
-            # Remove handler to avoid serialization issues
-            if "handler" in task:
-                del task["handler"]
-            return task
-        return None
+        task = self.tasks.get(task_id)
+        return self._view(task) if task else None
     
     def get_all_tasks(self) -> List[Dict[str, Any]]:
         """Get status of all tasks"""
-        tasks = []
-        for task_id, task in self.tasks.items():
-            task_info = task.copy()
-            if "handler" in task_info:
-                del task_info["handler"]
-            tasks.append(task_info)
-        return tasks
+        return [self._view(task) for task in self.tasks.values()]
+    
+    def _view(self, task: ScheduledTask) -> Dict[str, Any]:
+        """Copy of the task's cached status dict (handler left out to avoid serialization issues)"""
+        view = self._views.get(task.id)
+        if view is None:
+            view = self._views[task.id] = task.to_dict(time.time() - self._now())
+        return dict(view)
+    
+    def get_execution_stats(self) -> Dict[str, int]:
+        """Task executions in flight and how many handlers are running under the concurrency limit"""
+        return {
+            "in_flight": len(self._running),
+            "executing": self._executing,
+            "max_concurrent": self._max_concurrent
+        }
     
     async def force_run_task(self, task_id: str) -> bool:
         """Force run a task immediately"""
@@ -393,12 +636,17 @@ class SchedulerService:
                 return False
             
             task = self.tasks[task_id]
-            task["next_run"] = new_start_time
+            if task.status == TaskStatus.PENDING:
+                self._drop_queued(task_id)  # the run at the old time
+            task.next_run = self._to_loop_time(new_start_time)
             if new_interval:
-                task["interval_seconds"] = new_interval
-            task["status"] = TaskStatus.PENDING
+                task.interval_seconds = new_interval
+            task.move_to(TaskStatus.PENDING)
+            if task_id not in self._running:  # else queued once the execution finishes
+                self._push(task_id, task)
+            self._views.pop(task_id, None)
             
-            logger.info(f"Task rescheduled: {task_id} for {new_start_time}")
+            logger.debug(f"Task rescheduled: {task_id} for {new_start_time}")
             return True
             
         except Exception as e:
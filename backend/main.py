@@ -1,15 +1,20 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Response
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import time
+import anyio
+import orjson
 from datetime import datetime
 
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.cors import CORSMiddleware
+from app.core.database import create_tables
+from app.core.responses import ORJSONResponse
 from app.api.v1.api import api_router
+from app.api.v1.endpoints.air_quality import cache_service, external_api_service
 from app.core.auth import get_current_user
+from app.core.rate_limit import rate_limiter
 from app.services.ml_service import MLService
 from app.services.notification_service import NotificationService
 from app.services.scheduler_service import SchedulerService
@@ -24,7 +29,7 @@ logger = logging.getLogger(__name__)
 # Global services
 ml_service = MLService()
 notification_service = NotificationService()
-scheduler_service = SchedulerService()
+scheduler_service = SchedulerService(ml_service=ml_service, notification_service=notification_service)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -32,14 +37,19 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting AIRSHIELD API server...")
     
+    # Room for concurrent password hashing and other thread-offloaded work
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.WORKER_THREADS
+    
     # Create database tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await create_tables()
     
-    # Initialize services
-    await ml_service.initialize()
-    await notification_service.initialize()
-    await scheduler_service.initialize()
+    # Initialize services; ML models load in the background and /health reports
+    # the ML service as initializing until they're done
+    await rate_limiter.initialize()
+    await cache_service.initialize()
+    await external_api_service.initialize()
+    ml_init = asyncio.create_task(ml_service.initialize())
+    await asyncio.gather(notification_service.initialize(), scheduler_service.initialize())
     
     logger.info("AIRSHIELD API server started successfully")
     
@@ -48,8 +58,13 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down AIRSHIELD API server...")
     await scheduler_service.shutdown()
+    ml_init.cancel()
+    await asyncio.gather(ml_init, return_exceptions=True)
     await ml_service.shutdown()
     await notification_service.shutdown()
+    await external_api_service.shutdown()
+    await cache_service.shutdown()
+    await rate_limiter.shutdown()
     logger.info("AIRSHIELD API server shutdown complete")
 
 # Create FastAPI application
@@ -58,6 +73,7 @@ app = FastAPI(
     description="Your Personal Pollution Defense System - API",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.ENVIRONMENT != "production" else None,
     redoc_url="/redoc" if settings.ENVIRONMENT != "production" else None,
 )
@@ -74,40 +90,50 @@ app.add_middleware(
 # Add custom middleware for request logging
 @app.middleware("http")
 async def log_requests(request, call_next):
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     response = await call_next(request)
     
-    process_time = time.time() - start_time
-    logger.info(
-        f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s"
-    )
+    process_time = time.perf_counter() - start_time
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s"
+        )
     
-    response.headers["X-Process-Time"] = str(process_time)
+    response.headers["X-Process-Time"] = format(process_time, ".4f")
     return response
 
+# Static bodies for the root and health endpoints, which probes hit constantly
+ROOT_BODY = orjson.dumps({
+    "message": "AIRSHIELD API - Your Personal Pollution Defense System",
+    "version": "1.0.0",
+    "status": "running",
+    "docs": "/docs" if settings.ENVIRONMENT != "production" else None,
+})
+HEALTH_BASE = {
+    "status": "healthy",
+    "version": "1.0.0",
+}
+HEALTH_SERVICES = {
+    "database": "connected",
+    "scheduler": "running"
+}
+
 # Root endpoint
 @app.get("/")
 async def root():
-    return {
-        "message": "AIRSHIELD API - Your Personal Pollution Defense System",
-        "version": "1.0.0",
-        "status": "running",
-        "docs": "/docs" if settings.ENVIRONMENT != "production" else None,
-    }
+    return Response(content=ROOT_BODY, media_type="application/json")
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
-        "status": "healthy",
+        **HEALTH_BASE,
         "timestamp": datetime.utcnow().isoformat(),
-        "version": "1.0.0",
         "services": {
-            "database": "connected",
-            "ml_service": "active",
-            "scheduler": "running"
+            **HEALTH_SERVICES,
+            "ml_service": "active" if ml_service.ready.is_set() else "initializing"
         }
     }
 
@@ -117,7 +143,7 @@ app.include_router(api_router, prefix="/api/v1")
 # Global exception handler
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": {
@@ -132,7 +158,7 @@ async def http_exception_handler(request, exc):
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     logger.error(f"Unhandled exception: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": {
@@ -144,14 +170,15 @@ async def general_exception_handler(request, exc):
     )
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    import time
-    from datetime import datetime
     
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows build
+        http="httptools",
         reload=settings.ENVIRONMENT == "development",
         log_level="info"
     )
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Export the saved scikit-learn prediction model to ONNX for ONNX Runtime.
+
+MLService loads PREDICTION_ONNX_MODEL_PATH in preference to the joblib/pickle file when
+onnxruntime is installed. Requires skl2onnx.
+
+Usage:
+    python scripts/convert_prediction_model.py [MODEL_PATH] [OUTPUT_PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import joblib
+import numpy as np
+from skl2onnx import to_onnx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# temperature, humidity, pressure, wind_speed, hour, day_of_week (see MLService._prepare_prediction_features)
+SAMPLE_FEATURES = np.array([[20.0, 50.0, 1013.0, 2.0, 12, 3]], dtype=np.float32)
+
+
+def convert(model_path: str, output_path: str) -> None:
+    """Convert the estimator at ``model_path`` and write the .onnx file"""
+    model = joblib.load(model_path)
+
+    # Plain probability tensors rather than per-row dicts for classifiers
+    options = {type(model): {"zipmap": False}} if hasattr(model, "predict_proba") else None
+    onnx_model = to_onnx(model, SAMPLE_FEATURES, options=options, target_opset=17)
+
+    with open(output_path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+    logger.info(f"Wrote ONNX model to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the prediction model to ONNX")
+    parser.add_argument("model_path", nargs="?", default=settings.PREDICTION_MODEL_PATH)
+    parser.add_argument("output_path", nargs="?", default=settings.PREDICTION_ONNX_MODEL_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    convert(args.model_path, args.output_path)
+
+
+if __name__ == "__main__":
+    main()
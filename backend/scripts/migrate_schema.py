@@ -0,0 +1,127 @@
+"""
+One-off upgrade of a database created by an earlier version of the schema.
+
+create_all only creates missing tables, so tables that already exist keep their old
+columns. This script adds and backfills the columns added later, converts VARCHAR ids
+to native UUID and JSON columns to JSONB, and adds the user_id foreign keys. It runs
+in one transaction, and each step is a no-op on a database that is already current.
+
+Run it once, before starting the upgraded API. The column type changes rewrite the
+tables under ACCESS EXCLUSIVE locks, so plan for downtime on large tables. Any id that
+isn't a valid UUID makes the conversion fail and rolls back the whole upgrade.
+
+Usage:
+    python scripts/migrate_schema.py
+"""
+import asyncio
+import logging
+import os
+import sys
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Identifier columns migrated from VARCHAR to native UUID
+UUID_COLUMNS = (
+    ("air_quality_readings", "id"),
+    ("air_quality_readings", "sensor_id"),
+    ("air_quality_readings", "user_id"),
+    ("user_profiles", "id"),
+    ("prediction_data", "id"),
+    ("prediction_data", "user_id"),
+    ("photo_submissions", "id"),
+    ("photo_submissions", "user_id"),
+    ("sensor_devices", "id"),
+    ("sensor_devices", "user_id"),
+    ("hotspot_alerts", "id"),
+)
+
+# JSON columns migrated to JSONB
+JSONB_COLUMNS = (
+    ("user_profiles", "notification_preferences"),
+    ("prediction_data", "weather_data"),
+    ("prediction_data", "traffic_data"),
+    ("prediction_data", "historical_data"),
+    ("photo_submissions", "device_info"),
+    ("photo_submissions", "weather_conditions"),
+    ("photo_submissions", "quality_indicators"),
+    ("sensor_devices", "alert_thresholds"),
+    ("hotspot_alerts", "recommended_actions"),
+    ("hotspot_alerts", "affected_area"),
+)
+
+# Tables whose user_id references user_profiles
+USER_REFERENCING_TABLES = ("air_quality_readings", "prediction_data", "photo_submissions", "sensor_devices")
+
+# Rewrites only columns whose current type is ``from_type``
+CONVERT_COLUMNS = """
+DO $$
+DECLARE col record;
+BEGIN
+    FOR col IN
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND data_type = '{from_type}'
+          AND (table_name, column_name) IN (VALUES {columns})
+    LOOP
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN %I TYPE {to_type} USING %I::{to_type}',
+                       col.table_name, col.column_name, col.column_name);
+    END LOOP;
+END $$
+"""
+
+# Foreign keys are added NOT VALID so rows predating the constraint don't block the upgrade
+ADD_USER_FOREIGN_KEY = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = '{table}'::regclass AND conname = '{table}_user_id_fkey'
+    ) THEN
+        ALTER TABLE {table} ADD CONSTRAINT {table}_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES user_profiles (id) NOT VALID;
+    END IF;
+END $$
+"""
+
+
+def _values(columns) -> str:
+    return ", ".join(f"('{table}', '{column}')" for table, column in columns)
+
+
+SCHEMA_UPGRADES = (
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS subscription_tier_level INTEGER DEFAULT 0",
+    "UPDATE user_profiles SET subscription_tier_level = CASE subscription_tier "
+    "WHEN 'enterprise' THEN 2 WHEN 'pro' THEN 1 ELSE 0 END "
+    "WHERE subscription_tier_level IS DISTINCT FROM CASE subscription_tier "
+    "WHEN 'enterprise' THEN 2 WHEN 'pro' THEN 1 ELSE 0 END",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS last_query_reset_epoch_day INTEGER",
+    CONVERT_COLUMNS.format(from_type="character varying", to_type="uuid", columns=_values(UUID_COLUMNS)),
+    CONVERT_COLUMNS.format(from_type="json", to_type="jsonb", columns=_values(JSONB_COLUMNS)),
+    *(ADD_USER_FOREIGN_KEY.format(table=table) for table in USER_REFERENCING_TABLES),
+)
+
+
+async def migrate() -> None:
+    """Apply SCHEMA_UPGRADES in a single transaction"""
+    async with engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            logger.info("Schema upgrades only apply to PostgreSQL; nothing to do")
+            return
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+    logger.info("Schema upgraded")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Convert the image-to-PM2.5 model to a full-integer (INT8) TFLite model.
+
+Weights and activations are quantized using a representative sample of
+preprocessed images; the model takes raw uint8 RGB pixels and returns int8
+outputs, which MLService dequantizes with the output's (scale, zero_point).
+
+Usage:
+    python scripts/quantize_image_model.py SAVED_MODEL_DIR IMAGE_DIR [OUTPUT_PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+REPRESENTATIVE_SAMPLES = 200
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def representative_dataset(image_dir: str, size: tuple, samples: int = REPRESENTATIVE_SAMPLES):
+    """Yield calibration images preprocessed as the float model expects them (RGB, scaled to [0, 1])"""
+    def generator():
+        names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names[:samples]:
+            image = cv2.imread(os.path.join(image_dir, name), cv2.IMREAD_COLOR)
+            if image is None:
+                logger.warning(f"Skipping unreadable image {name}")
+                continue
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            yield [(image[np.newaxis, ..., ::-1] / 255.0).astype(np.float32)]
+
+    return generator
+
+
+def convert(saved_model_dir: str, image_dir: str, output_path: str) -> None:
+    """Quantize the SavedModel at ``saved_model_dir`` and write the .tflite file"""
+    model = tf.saved_model.load(saved_model_dir)
+    input_spec = list(model.signatures["serving_default"].structured_input_signature[1].values())[0]
+    _, height, width, _ = input_spec.shape
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(image_dir, (width, height))
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.target_spec.supported_types = [tf.int8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.int8
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    logger.info(f"Wrote quantized model to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8-quantize the image-to-PM2.5 model")
+    parser.add_argument("saved_model_dir", help="SavedModel directory of the float model")
+    parser.add_argument("image_dir", help="Directory of sample sky images used for calibration")
+    parser.add_argument("output_path", nargs="?", default=settings.IMAGE_MODEL_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    convert(args.saved_model_dir, args.image_dir, args.output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Re-save the prediction model with joblib, uncompressed, so its large numpy
+arrays can be memory-mapped when MLService loads it with mmap_mode='r'.
+
+Usage:
+    python scripts/resave_prediction_model.py [MODEL_PATH] [OUTPUT_PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import joblib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def resave(model_path: str, output_path: str) -> None:
+    """Load the estimator at ``model_path`` (pickle or joblib) and dump it mmap-able to ``output_path``"""
+    model = joblib.load(model_path)
+    joblib.dump(model, output_path, compress=0, protocol=5)
+    logger.info(f"Wrote memory-mappable model to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-save the prediction model for memory-mapped loading")
+    parser.add_argument("model_path", nargs="?", default=settings.PREDICTION_MODEL_PATH)
+    parser.add_argument("output_path", nargs="?", default=settings.PREDICTION_MODEL_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    resave(args.model_path, args.output_path)
+
+
+if __name__ == "__main__":
+    main()
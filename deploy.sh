@@ -89,6 +89,7 @@ async def init_db():
 
 asyncio.run(init_db())
 "
+    docker-compose run --rm backend python scripts/migrate_schema.py
     echo "✅ Backend setup complete"
 else
     echo "⚠️ Backend directory not found, skipping backend setup"